@@ -27,43 +27,22 @@ else:
     TEST_CLEAN_DIR = Path('Datasets/clean_testset_wav') 
 
 import os
-basepath = str(noise_class)+"_"+training_type
-os.makedirs(basepath,exist_ok=True)
-os.makedirs(basepath+"/Weights",exist_ok=True)
-os.makedirs(basepath+"/Samples",exist_ok=True)
-
-import time
-import pickle
+import glob
 import warnings
-import gc
-import copy
-
-import noise_addition_utils
-
-from metrics import AudioMetrics
-from metrics import AudioMetrics2
 
 import numpy as np
 import torch
-import torch.nn as nn
-import torchaudio
-
-from tqdm import tqdm, tqdm_notebook
 from torch.utils.data import Dataset, DataLoader
-from matplotlib import colors, pyplot as plt
-from pypesq import pesq
-from IPython.display import clear_output
-
-warnings.filterwarnings(action='ignore', category=DeprecationWarning)
 
+from dcunet import SAMPLE_RATE, N_FFT, HOP_LENGTH
+from dcunet import CConv2d, CConvTranspose2d, CBatchNorm2d, Encoder, Decoder, DCUnet20
 
-np.random.seed(999)
-torch.manual_seed(999)
-
-# If running on Cuda set these 2 for determinism
-torch.backends.cudnn.deterministic = True
-torch.backends.cudnn.benchmark = False
+# Importing this module only needs torch: the output directories, dataset scans,
+# DataLoaders and the training/evaluation dependencies (torchaudio, metrics with
+# numba/scipy/pystoi, pypesq, tqdm, matplotlib, IPython) are set up on demand.
+basepath = str(noise_class)+"_"+training_type
 
+warnings.filterwarnings(action='ignore', category=DeprecationWarning)
 
 # First checking if GPU is available
 train_on_gpu=torch.cuda.is_available()
@@ -75,14 +54,26 @@ train_on_gpu=torch.cuda.is_available()
        
 DEVICE = torch.device('cuda' if train_on_gpu else 'cpu')
 
-torchaudio.set_audio_backend("soundfile")
-# print("TorchAudio backend used:\t{}".format(torchaudio.get_audio_backend()))
 
-SAMPLE_RATE = 48000
-N_FFT = (SAMPLE_RATE * 64) // 1000 
-HOP_LENGTH = (SAMPLE_RATE * 16) // 1000 
+def setup():
+    """
+    Seeds, output directories and the audio backend for training and evaluation runs.
+    """
+    import torchaudio
+
+    np.random.seed(999)
+    torch.manual_seed(999)
+
+    # If running on Cuda set these 2 for determinism
+    torch.backends.cudnn.deterministic = True
+    torch.backends.cudnn.benchmark = False
 
+    os.makedirs(basepath,exist_ok=True)
+    os.makedirs(basepath+"/Weights",exist_ok=True)
+    os.makedirs(basepath+"/Samples",exist_ok=True)
 
+    torchaudio.set_audio_backend("soundfile")
+    # print("TorchAudio backend used:\t{}".format(torchaudio.get_audio_backend()))
 
 
 class SpeechDataset(Dataset):
@@ -90,7 +81,7 @@ class SpeechDataset(Dataset):
     A dataset class with audio that cuts them/paddes them to a specified length, applies a Short-tome Fourier transform,
     normalizes and leads to a tensor.
     """
-    def __init__(self, noisy_files, clean_files, n_fft=64, hop_length=16):
+    def __init__(self, noisy_files, clean_files, n_fft=64, hop_length=16, return_complex=False):
         super().__init__()
         # list of files
         self.noisy_files = sorted(noisy_files)
@@ -100,6 +91,9 @@ class SpeechDataset(Dataset):
         self.n_fft = n_fft
         self.hop_length = hop_length
         
+        # complex spectrograms for DCUnet20Native instead of the stacked real/imag layout
+        self.return_complex = return_complex
+        
         self.len_ = len(self.noisy_files)
         
         # fixed len
@@ -110,6 +104,7 @@ class SpeechDataset(Dataset):
         return self.len_
       
     def load_sample(self, file):
+        import torchaudio
         waveform, _ = torchaudio.load(file)
         return waveform
   
@@ -124,72 +119,48 @@ class SpeechDataset(Dataset):
         
         # Short-time Fourier transform
         x_noisy_stft = torch.stft(input=x_noisy, n_fft=self.n_fft, 
-                                  hop_length=self.hop_length, normalized=True)
+                                  hop_length=self.hop_length, normalized=True, return_complex=True)
         x_clean_stft = torch.stft(input=x_clean, n_fft=self.n_fft, 
-                                  hop_length=self.hop_length, normalized=True)
+                                  hop_length=self.hop_length, normalized=True, return_complex=True)
+        
+        if not self.return_complex:
+            x_noisy_stft = torch.view_as_real(x_noisy_stft)
+            x_clean_stft = torch.view_as_real(x_clean_stft)
         
         return x_noisy_stft, x_clean_stft
         
-    def _prepare_sample(self, waveform, save_dir="Samples/Sample_Test_Input"):
+    def _prepare_sample(self, waveform):
         waveform = waveform.numpy()
         current_len = waveform.shape[1]
-
-    # Initialize a zero-padded array
+        
         output = np.zeros((1, self.max_len), dtype='float32')
-
-        if current_len > self.max_len:
-        # Save the remaining signal instead of discarding
-            remaining_signal = waveform[:, self.max_len:]
-
-        # Ensure save directory exists
-            os.makedirs(save_dir, exist_ok=True)
-
-        # Always save as "remaining_part.wav"
-            remaining_filename = os.path.join(save_dir, "!!remaining_part.wav")
-
-        # Convert NumPy array back to Torch tensor before saving
-        # Ensure the signal is 2D (add channel dimension if needed)
-            remaining_signal_tensor = torch.from_numpy(remaining_signal)
-
-            if remaining_signal_tensor.ndimension() == 1:
-            # If the tensor is 1D, add a channel dimension (for mono)
-                remaining_signal_tensor = remaining_signal_tensor.unsqueeze(0)
-
-        # Save the remaining part of the audio
-            torchaudio.save(remaining_filename, remaining_signal_tensor, 48000)
-
-        # Keep only the first `max_len` part in the output
-            waveform = waveform[:, :self.max_len]
-
-    # Copy the trimmed/padded waveform into the output array
         output[0, -current_len:] = waveform[0, :self.max_len]
-
-    # Convert back to tensor
         output = torch.from_numpy(output)
-
+        
         return output
     
 
 
-train_input_files = sorted(list(TRAIN_INPUT_DIR.rglob('*.wav')))
-train_target_files = sorted(list(TRAIN_TARGET_DIR.rglob('*.wav')))
-
-test_noisy_files = sorted(list(TEST_NOISY_DIR.rglob('*.wav')))
-test_clean_files = sorted(list(TEST_CLEAN_DIR.rglob('*.wav')))
-
-
-
+def build_loaders():
+    """
+    Scans the dataset folders and returns the train, test and unshuffled single-sample test loaders.
+    """
+    train_input_files = sorted(list(TRAIN_INPUT_DIR.rglob('*.wav')))
+    train_target_files = sorted(list(TRAIN_TARGET_DIR.rglob('*.wav')))
 
+    test_noisy_files = sorted(list(TEST_NOISY_DIR.rglob('*.wav')))
+    test_clean_files = sorted(list(TEST_CLEAN_DIR.rglob('*.wav')))
 
-test_dataset = SpeechDataset(test_noisy_files, test_clean_files, N_FFT, HOP_LENGTH)
-train_dataset = SpeechDataset(train_input_files, train_target_files, N_FFT, HOP_LENGTH)
+    test_dataset = SpeechDataset(test_noisy_files, test_clean_files, N_FFT, HOP_LENGTH)
+    train_dataset = SpeechDataset(train_input_files, train_target_files, N_FFT, HOP_LENGTH)
 
+    test_loader = DataLoader(test_dataset, batch_size=1, shuffle=True)
+    train_loader = DataLoader(train_dataset, batch_size=2, shuffle=True)
 
-test_loader = DataLoader(test_dataset, batch_size=1, shuffle=True)
-train_loader = DataLoader(train_dataset, batch_size=2, shuffle=True)
+    # For testing purpose
+    test_loader_single_unshuffled = DataLoader(test_dataset, batch_size=1, shuffle=False)
 
-# For testing purpose
-test_loader_single_unshuffled = DataLoader(test_dataset, batch_size=1, shuffle=False)
+    return train_loader, test_loader, test_loader_single_unshuffled
 
 
 
@@ -219,456 +190,36 @@ test_loader_single_unshuffled = DataLoader(test_dataset, batch_size=1, shuffle=F
 
 
 
-class CConv2d(nn.Module):
-    """
-    Class of complex valued convolutional layer
-    """
-    def __init__(self, in_channels, out_channels, kernel_size, stride=1, padding=0):
-        super().__init__()
-        
-        self.in_channels = in_channels
-        self.out_channels = out_channels
-        self.kernel_size = kernel_size
-        self.padding = padding
-        self.stride = stride
-        
-        self.real_conv = nn.Conv2d(in_channels=self.in_channels, 
-                                   out_channels=self.out_channels, 
-                                   kernel_size=self.kernel_size, 
-                                   padding=self.padding, 
-                                   stride=self.stride)
-        
-        self.im_conv = nn.Conv2d(in_channels=self.in_channels, 
-                                 out_channels=self.out_channels, 
-                                 kernel_size=self.kernel_size, 
-                                 padding=self.padding, 
-                                 stride=self.stride)
-        
-        # Glorot initialization.
-        nn.init.xavier_uniform_(self.real_conv.weight)
-        nn.init.xavier_uniform_(self.im_conv.weight)
-        
-        
-    def forward(self, x):
-        x_real = x[..., 0]
-        x_im = x[..., 1]
-        
-        c_real = self.real_conv(x_real) - self.im_conv(x_im)
-        c_im = self.im_conv(x_real) + self.real_conv(x_im)
-        
-        output = torch.stack([c_real, c_im], dim=-1)
-        return output
-    
-
-
-class CConvTranspose2d(nn.Module):
-    """
-      Class of complex valued dilation convolutional layer
-    """
-    def __init__(self, in_channels, out_channels, kernel_size, stride, output_padding=0, padding=0):
-        super().__init__()
-        
-        self.in_channels = in_channels
-
-        self.out_channels = out_channels
-        self.kernel_size = kernel_size
-        self.output_padding = output_padding
-        self.padding = padding
-        self.stride = stride
-        
-        self.real_convt = nn.ConvTranspose2d(in_channels=self.in_channels, 
-                                            out_channels=self.out_channels, 
-                                            kernel_size=self.kernel_size, 
-                                            output_padding=self.output_padding,
-                                            padding=self.padding,
-                                            stride=self.stride)
-        
-        self.im_convt = nn.ConvTranspose2d(in_channels=self.in_channels, 
-                                            out_channels=self.out_channels, 
-                                            kernel_size=self.kernel_size, 
-                                            output_padding=self.output_padding, 
-                                            padding=self.padding,
-                                            stride=self.stride)
-        
-        
-        # Glorot initialization.
-        nn.init.xavier_uniform_(self.real_convt.weight)
-        nn.init.xavier_uniform_(self.im_convt.weight)
-        
-        
-    def forward(self, x):
-        x_real = x[..., 0]
-        x_im = x[..., 1]
-        
-        ct_real = self.real_convt(x_real) - self.im_convt(x_im)
-        ct_im = self.im_convt(x_real) + self.real_convt(x_im)
-        
-        output = torch.stack([ct_real, ct_im], dim=-1)
-        return output
-    
-
-
-
-class CBatchNorm2d(nn.Module):
-    """
-    Class of complex valued batch normalization layer
-    """
-    def __init__(self, num_features, eps=1e-05, momentum=0.1, affine=True, track_running_stats=True):
-        super().__init__()
-        
-        self.num_features = num_features
-        self.eps = eps
-        self.momentum = momentum
-        self.affine = affine
-        self.track_running_stats = track_running_stats
-        
-        self.real_b = nn.BatchNorm2d(num_features=self.num_features, eps=self.eps, momentum=self.momentum,
-                                      affine=self.affine, track_running_stats=self.track_running_stats)
-        self.im_b = nn.BatchNorm2d(num_features=self.num_features, eps=self.eps, momentum=self.momentum,
-                                    affine=self.affine, track_running_stats=self.track_running_stats) 
-        
-    def forward(self, x):
-        x_real = x[..., 0]
-        x_im = x[..., 1]
-        
-        n_real = self.real_b(x_real)
-        n_im = self.im_b(x_im)  
-        
-        output = torch.stack([n_real, n_im], dim=-1)
-        return output
-    
-
-
-class Encoder(nn.Module):
-    """
-    Class of upsample block
-    """
-    def __init__(self, filter_size=(7,5), stride_size=(2,2), in_channels=1, out_channels=45, padding=(0,0)):
-        super().__init__()
-        
-        self.filter_size = filter_size
-        self.stride_size = stride_size
-        self.in_channels = in_channels
-        self.out_channels = out_channels
-        self.padding = padding
-
-        self.cconv = CConv2d(in_channels=self.in_channels, out_channels=self.out_channels, 
-                             kernel_size=self.filter_size, stride=self.stride_size, padding=self.padding)
-        
-        self.cbn = CBatchNorm2d(num_features=self.out_channels) 
-        
-        self.leaky_relu = nn.LeakyReLU()
-            
-    def forward(self, x):
-        
-        conved = self.cconv(x)
-        normed = self.cbn(conved)
-        acted = self.leaky_relu(normed)
-        
-        return acted
-    
-
-
-
-
-class Decoder(nn.Module):
-    """
-    Class of downsample block
-    """
-    def __init__(self, filter_size=(7,5), stride_size=(2,2), in_channels=1, out_channels=45,
-                 output_padding=(0,0), padding=(0,0), last_layer=False):
-        super().__init__()
-        
-        self.filter_size = filter_size
-        self.stride_size = stride_size
-        self.in_channels = in_channels
-        self.out_channels = out_channels
-        self.output_padding = output_padding
-        self.padding = padding
-        
-        self.last_layer = last_layer
-        
-        self.cconvt = CConvTranspose2d(in_channels=self.in_channels, out_channels=self.out_channels, 
-                             kernel_size=self.filter_size, stride=self.stride_size, output_padding=self.output_padding, padding=self.padding)
-        
-        self.cbn = CBatchNorm2d(num_features=self.out_channels) 
-        
-        self.leaky_relu = nn.LeakyReLU()
-            
-    def forward(self, x):
-        
-        conved = self.cconvt(x)
-        
-        if not self.last_layer:
-            normed = self.cbn(conved)
-            output = self.leaky_relu(normed)
-        else:
-            m_phase = conved / (torch.abs(conved) + 1e-8)
-            m_mag = torch.tanh(torch.abs(conved))
-            output = m_phase * m_mag
-            
-        return output
-    
-
-
-
-
-class DCUnet20(nn.Module):
-    """
-    Deep Complex U-Net class of the model.
-    """
-    def __init__(self, n_fft=64, hop_length=16):
-        super().__init__()
-        
-        # for istft
-        self.n_fft = n_fft
-        self.hop_length = hop_length
-        
-        self.set_size(model_complexity=int(45//1.414), input_channels=1, model_depth=20)
-        self.encoders = []
-        self.model_length = 20 // 2
-        
-        for i in range(self.model_length):
-            module = Encoder(in_channels=self.enc_channels[i], out_channels=self.enc_channels[i + 1],
-                             filter_size=self.enc_kernel_sizes[i], stride_size=self.enc_strides[i], padding=self.enc_paddings[i])
-            self.add_module("encoder{}".format(i), module)
-            self.encoders.append(module)
-
-        self.decoders = []
-
-        for i in range(self.model_length):
-            if i != self.model_length - 1:
-                module = Decoder(in_channels=self.dec_channels[i] + self.enc_channels[self.model_length - i], out_channels=self.dec_channels[i + 1], 
-                                 filter_size=self.dec_kernel_sizes[i], stride_size=self.dec_strides[i], padding=self.dec_paddings[i],
-                                 output_padding=self.dec_output_padding[i])
-            else:
-                module = Decoder(in_channels=self.dec_channels[i] + self.enc_channels[self.model_length - i], out_channels=self.dec_channels[i + 1], 
-                                 filter_size=self.dec_kernel_sizes[i], stride_size=self.dec_strides[i], padding=self.dec_paddings[i],
-                                 output_padding=self.dec_output_padding[i], last_layer=True)
-            self.add_module("decoder{}".format(i), module)
-            self.decoders.append(module)
-       
-        
-    def forward(self, x, is_istft=True):
-        # print('x : ', x.shape)
-        orig_x = x
-        xs = []
-        for i, encoder in enumerate(self.encoders):
-            xs.append(x)
-            x = encoder(x)
-            # print('Encoder : ', x.shape)
-            
-        p = x
-        for i, decoder in enumerate(self.decoders):
-            p = decoder(p)
-            if i == self.model_length - 1:
-                break
-            # print('Decoder : ', p.shape)
-            p = torch.cat([p, xs[self.model_length - 1 - i]], dim=1)
-        
-        # u9 - the mask
-        
-        mask = p
-        
-        # print('mask : ', mask.shape)
-        
-        output = mask * orig_x
-        output = torch.squeeze(output, 1)
-
-
-        if is_istft:
-            output = torch.istft(output, n_fft=self.n_fft, hop_length=self.hop_length, normalized=True)
-        
-        return output
-
-    
-    def set_size(self, model_complexity, model_depth=20, input_channels=1):
-
-        if model_depth == 20:
-            self.enc_channels = [input_channels,
-                                 model_complexity,
-                                 model_complexity,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 128]
-
-            self.enc_kernel_sizes = [(7, 1),
-                                     (1, 7),
-                                     (6, 4),
-                                     (7, 5),
-                                     (5, 3),
-                                     (5, 3),
-                                     (5, 3),
-                                     (5, 3),
-                                     (5, 3),
-                                     (5, 3)]
-
-            self.enc_strides = [(1, 1),
-                                (1, 1),
-                                (2, 2),
-                                (2, 1),
-                                (2, 2),
-                                (2, 1),
-                                (2, 2),
-                                (2, 1),
-                                (2, 2),
-                                (2, 1)]
-
-            self.enc_paddings = [(3, 0),
-                                 (0, 3),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0)]
-
-            self.dec_channels = [0,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity * 2,
-                                 model_complexity,
-                                 model_complexity,
-                                 1]
-
-            self.dec_kernel_sizes = [(6, 3), 
-                                     (6, 3),
-                                     (6, 3),
-                                     (6, 4),
-                                     (6, 3),
-                                     (6, 4),
-                                     (8, 5),
-                                     (7, 5),
-                                     (1, 7),
-                                     (7, 1)]
-
-            self.dec_strides = [(2, 1), #
-                                (2, 2), #
-                                (2, 1), #
-                                (2, 2), #
-                                (2, 1), #
-                                (2, 2), #
-                                (2, 1), #
-                                (2, 2), #
-                                (1, 1),
-                                (1, 1)]
-
-            self.dec_paddings = [(0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 0),
-                                 (0, 3),
-                                 (3, 0)]
-            
-            self.dec_output_padding = [(0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0),
-                                       (0,0)]
-        else:
-            raise ValueError("Unknown model depth : {}".format(model_depth))
-        
-
-
-
-
 model_weights_path = "Pretrained_Weights/Noise2Noise/mixed.pth"
 
-dcunet20 = DCUnet20(N_FFT, HOP_LENGTH).to(DEVICE)
-optimizer = torch.optim.Adam(dcunet20.parameters())
-
-checkpoint = torch.load(model_weights_path,
-                        map_location=torch.device('cpu')
-                       )
-
 
-# test_noisy_files = sorted(list(Path("Samples/Sample_Test_Input").rglob('*.wav')))
-test_clean_files = sorted(list(Path("Samples/Sample_Test_Target").rglob('*.wav')))
+def main():
+    import torchaudio
 
-# test_dataset = SpeechDataset(test_noisy_files, test_clean_files, N_FFT, HOP_LENGTH)
+    # The engine splits the input into 165000-sample blocks in memory and runs them
+    # through the model in batches, instead of writing the overflow back to disk.
+    from inference import DenoiseEngine
 
-# For testing purpose
-# test_loader_single_unshuffled = DataLoader(test_dataset, batch_size=1, shuffle=False)
+    setup()
 
+    engine = DenoiseEngine(model_weights_path, DEVICE)
 
+    input_audio, sr = torchaudio.load(glob.glob("Samples/Sample_Test_Input/*.wav")[0])
+    torchaudio.save("Samples/noisy.wav", input_audio, 48000, bits_per_sample=16)
 
-dcunet20.load_state_dict(checkpoint)
-
-import glob
-input_audio, sr = torchaudio.load(glob.glob("Samples/Sample_Test_Input/*.wav")[0])
-torchaudio.save("Samples/noisy.wav", input_audio, 48000, bits_per_sample=16)
-
-
-outputensor=[]
-dcunet20.eval()
-modelprocessinglength=165000/SAMPLE_RATE
-lengthofinput=input_audio.size(1)/sr
-noofloop=np.ceil(lengthofinput/modelprocessinglength)
-for _ in range(int(noofloop)):
-    test_noisy_files = sorted(list(Path("Samples/Sample_Test_Input").rglob('*.wav')))
-    test_dataset = SpeechDataset(test_noisy_files, test_clean_files, N_FFT, HOP_LENGTH)
-    test_loader_single_unshuffled = DataLoader(test_dataset, batch_size=1, shuffle=False)
-    
-    index=0
-    test_loader_single_unshuffled_iter = iter(test_loader_single_unshuffled)
-
-    x_n, x_c = next(test_loader_single_unshuffled_iter)
-   
-    x_est = dcunet20(x_n, is_istft=True)
-    
-    x_est_np = x_est[0].view(-1).detach().cpu().numpy()
-    
-    torch_tensor = torch.from_numpy(x_est_np.astype(np.float32))
-    outputensor.append(torch_tensor)
-    
-
-
-Final_Outputaudio = torch.cat(outputensor, dim=0)    
-
-# Reshape to 2D tensor: (1, num_samples)
-Final_Outputaudio = Final_Outputaudio.unsqueeze(0)
-
-
-# Check if denoised file is longer than noisy file
-if Final_Outputaudio.size(1) > input_audio.size(1):
-    # Crop the denoised file to the same length as the noisy file
-    Final_Outputaudio = Final_Outputaudio[:, :input_audio.size(1)]
-    print("Denoised file cropped to match the noisy file length.")
-else:
-    print("Denoised file is already the same length or shorter than the noisy file.")
-
-
+    Final_Outputaudio = engine.denoise(input_audio, sr)
 
-# Save the audio as a 2D tensor (1 channel)
-torchaudio.save("Samples/denoised.wav", Final_Outputaudio, 48000, bits_per_sample=16)
+    # Save the audio as a 2D tensor (channels, samples)
+    torchaudio.save("Samples/denoised.wav", Final_Outputaudio, 48000, bits_per_sample=16)
 
+    #Clearing input folder for next audio
+    # Set the folder path
+    folder_path = "Samples/Sample_Test_Input"
 
+    # Remove all .wav files in the folder
+    for file in glob.glob(os.path.join(folder_path, "*.wav")):
+        os.remove(file)
 
-#Clearing input folder for next audio
-# Set the folder path
-folder_path = "Samples/Sample_Test_Input"
 
-# Remove all .wav files in the folder
-for file in glob.glob(os.path.join(folder_path, "*.wav")):
-    os.remove(file)
-    
\ No newline at end of file
+if __name__ == "__main__":
+    main()
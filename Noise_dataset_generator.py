@@ -1,5 +1,4 @@
 import numpy as np
-from scipy import interpolate
 from scipy.io import wavfile
 import os
 import random
@@ -29,18 +28,6 @@ torchaudio.set_audio_backend("soundfile")
 
 from pydub import AudioSegment
 
-
-def resample(original, old_rate, new_rate):
-    if old_rate != new_rate:
-        duration = original.shape[0] / old_rate
-        time_old  = np.linspace(0, duration, original.shape[0])
-        time_new  = np.linspace(0, duration, int(original.shape[0] * new_rate / old_rate))
-        interpolator = interpolate.interp1d(time_old, original.T)
-        new_audio = interpolator(time_new).T
-        return new_audio
-    else:
-        return original
-
 fold_names = []
 for i in range(1,11):
     fold_names.append("fold"+str(i)+"/")
@@ -0,0 +1,138 @@
+"""
+In-memory audio decoding and encoding for the server.
+
+Uploads are piped through ffmpeg's stdin/stdout straight into a float32 NumPy
+buffer and results are encoded into WAV bytes, so a request never touches disk.
+"""
+import io
+import struct
+import wave
+
+import ffmpeg
+import numpy as np
+
+from dcunet import SAMPLE_RATE
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _parse_wav(data):
+    """
+    Parses a RIFF/WAVE byte string into ((channels, samples) float32 array, sample rate).
+
+    Handles 16/32-bit integer and 32-bit float PCM. The data chunk may run to the
+    end of the buffer, as it does when ffmpeg writes WAV to a pipe.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioDecodeError("Not a WAV file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack("<4sI", data[offset:offset + 8])
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", data[body:body + 16])
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE:
+                # the real format tag is the start of the sub-format GUID
+                sub_format = struct.unpack("<H", data[body + 24:body + 26])[0]
+                fmt = (sub_format,) + fmt[1:]
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV data chunk before fmt chunk")
+            end = min(body + chunk_size, len(data))
+            if chunk_size in (0, 0xFFFFFFFF):
+                end = len(data)
+            return _pcm_to_float(data[body:end], fmt)
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise AudioDecodeError("WAV file has no data chunk")
+
+
+def _pcm_to_float(pcm, fmt):
+    format_tag, channels, sample_rate, _, _, bits = fmt
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        samples = np.frombuffer(pcm, dtype="<f4", count=len(pcm) // 4)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2) / np.float32(32768)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(pcm, dtype="<i4", count=len(pcm) // 4) / np.float32(2 ** 31)
+    else:
+        raise AudioDecodeError("Unsupported WAV format {} with {} bits".format(format_tag, bits))
+
+    samples = samples[:len(samples) - len(samples) % channels]
+    waveform = samples.reshape(-1, channels).T.astype(np.float32)
+    return waveform, sample_rate
+
+
+def decode_audio(data, channels=None, sample_rate=None):
+    """
+    Decodes uploaded audio bytes (WAV, WebM, OGG, M4A, ...) to a
+    (channels, samples) float32 array, keeping every channel and the source
+    sample rate unless `channels` / `sample_rate` ask ffmpeg to convert (the
+    engine resamples with resampling.py). Returns (waveform, sample rate).
+    """
+    options = {}
+    if channels:
+        options["ac"] = channels
+    if sample_rate:
+        options["ar"] = sample_rate
+    try:
+        out, _ = (ffmpeg.input("pipe:0")
+                  .output("pipe:1", format="wav", acodec="pcm_f32le", **options)
+                  .run(input=data, capture_stdout=True, capture_stderr=True))
+    except ffmpeg.Error as e:
+        message = e.stderr.decode(errors="replace").strip().splitlines()
+        raise AudioDecodeError(message[-1] if message else "ffmpeg failed")
+    return _parse_wav(out)
+
+
+def _to_pcm16(waveform):
+    waveform = np.asarray(waveform, dtype=np.float32)
+    if waveform.ndim == 1:
+        waveform = waveform[np.newaxis]
+    return (np.clip(waveform, -1, 1) * 32767).astype("<i2")
+
+
+def encode_wav(waveform, sample_rate=SAMPLE_RATE):
+    """
+    Encodes a (channels, samples) float array in [-1, 1] as 16-bit PCM WAV bytes.
+    """
+    pcm = _to_pcm16(waveform)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(pcm.shape[0])
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.T.tobytes())
+    return buffer.getvalue()
+
+
+def encode_pcm(waveform):
+    """
+    Interleaved 16-bit PCM bytes of a (channels, samples) float array, the data
+    that follows `wav_header` in a streamed WAV.
+    """
+    return _to_pcm16(waveform).T.tobytes()
+
+
+def wav_header(channels, sample_rate=SAMPLE_RATE, data_bytes=None):
+    """
+    44-byte header of a 16-bit PCM WAV. Without `data_bytes` the RIFF and data
+    sizes are 0xFFFFFFFF, the usual marker for a stream of unknown length.
+    """
+    block_align = 2 * channels
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    data_size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    return (struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE") +
+            struct.pack("<4sIHHIIHH", b"fmt ", 16, WAVE_FORMAT_PCM, channels, sample_rate,
+                        sample_rate * block_align, block_align, 16) +
+            struct.pack("<4sI", b"data", data_size))
@@ -0,0 +1,124 @@
+"""
+Dynamic micro-batching of DCUnet20 forwards across concurrent requests.
+
+Requests submit their waveform blocks and get a Future back. A single worker
+thread waits up to `max_wait_ms` for more blocks to arrive (or until
+`max_batch_size` blocks are queued), runs them through the model together and
+hands each request its own slice of the output.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+import telemetry
+from inference import _inference_mode
+
+
+class MicroBatcher():
+    """
+    Collects (n, samples) block tensors from many callers into shared forward passes.
+    """
+    def __init__(self, engine, max_batch_size=8, max_wait_ms=10):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, chunks):
+        """
+        Queues a (n, samples) tensor of blocks; the Future resolves to the denoised blocks.
+        Raises RuntimeError once the batcher is closed.
+        """
+        future = Future()
+        # for the batch_wait stage
+        future.submitted = time.perf_counter()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((chunks, future))
+        return future
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def close(self):
+        # blocks queued before closing are still processed
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        pending = [first]
+        size = first[0].size(0)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # keep the stop marker for the main loop
+                self._queue.put(None)
+                break
+            pending.append(item)
+            size += item[0].size(0)
+        return pending
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            pending = self._collect(item)
+
+            # Blocks of different lengths cannot share a batch
+            groups = {}
+            for chunks, future in pending:
+                groups.setdefault(chunks.size(-1), []).append((chunks, future))
+
+            for group in groups.values():
+                self._process(group)
+
+    def _process(self, group):
+        # skip requests that were cancelled while queued
+        group = [(chunks, future) for chunks, future in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+
+        started = time.perf_counter()
+        for _, future in group:
+            telemetry.REGISTRY.observe("stage_seconds", started - future.submitted, stage="batch_wait")
+
+        try:
+            batch = torch.cat([chunks for chunks, _ in group], dim=0)
+            with _inference_mode():
+                outputs = [self.engine.denoise_chunks(b.to(self.engine.device))
+                           for b in batch.split(self.max_batch_size, dim=0)]
+            output = torch.cat(outputs, dim=0).cpu()
+            telemetry.REGISTRY.observe("batch_blocks", batch.size(0), "Blocks per micro-batched forward")
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+
+        # Scatter the rows back to the requests they came from
+        offset = 0
+        for chunks, future in group:
+            n = chunks.size(0)
+            future.set_result(output[offset:offset + n])
+            offset += n
@@ -0,0 +1,287 @@
+"""
+Reproducible inference benchmark for DCUnet20.
+
+`run` denoises synthetic noisy speech-like signals (a harmonic voice with a
+syllable-rate envelope plus coloured noise from noise_addition_utils.noise)
+over a grid of durations, batch sizes (signals denoised together in the same
+forward passes), torch thread counts and backends, and writes latency,
+throughput and real-time factor per configuration to JSON. Each backend runs
+in a fresh process and its peak RSS is recorded once for the backend.
+`compare` checks a candidate result file against a baseline and exits with
+status 1 if any configuration got slower, or any backend bigger, than the
+threshold.
+
+    python benchmark.py run --weights Pretrained_Weights/Noise2Noise/white.pth \
+        --durations 1 5 20 --batch-sizes 1 4 --threads 1 4 --backends float32 optimize native --out new.json
+    python benchmark.py compare baseline.json new.json --threshold 0.1
+"""
+import argparse
+import ctypes
+import json
+import math
+import multiprocessing
+import platform
+import sys
+import time
+
+import numpy as np
+import torch
+
+from dcunet import SAMPLE_RATE
+from inference import DEFAULT_WEIGHTS
+
+# DenoiseEngine arguments of each backend; onnx and int8 take their own model files
+BACKENDS = {
+    "float32": {},
+    "optimize": {"optimize": True},
+    "native": {"native": True},
+    "bfloat16": {"precision": "bfloat16"},
+    "float16": {"precision": "float16"},
+    "onnx": {},
+    "int8": {},
+}
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MiB, None where it cannot be read.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+    if sys.platform == "win32":
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 2 ** 20
+    return None
+
+
+def noisy_speech(duration, snr_db=5.0, color="pink", seed=0):
+    """
+    (1, samples) float32 tensor: a voiced signal with a wandering pitch and
+    syllable-like bursts, plus `color` noise at `snr_db`.
+    """
+    from noise_addition_utils import noise
+
+    n = int(duration * SAMPLE_RATE)
+    rng = np.random.RandomState(seed)
+    t = np.arange(n) / SAMPLE_RATE
+
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t) + 10 * np.sin(2 * np.pi * 3.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 16))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, 2 * np.pi)), 0, None) ** 2
+    speech = voiced * envelope
+    speech *= 0.1 / math.sqrt(np.mean(speech ** 2) + 1e-12)
+
+    # noise_addition_utils draws from the global numpy generator
+    np.random.seed(seed)
+    power = np.mean(speech ** 2) / 10 ** (snr_db / 10)
+    noisy = speech + noise(n, color, power)
+    return torch.from_numpy(noisy.astype(np.float32)).unsqueeze(0)
+
+
+def run_backend(backend, config):
+    """
+    Benchmarks one backend over the duration/batch size/thread grid. Returns the
+    result rows and a summary of the backend (load time, peak RSS of the process).
+    """
+    from inference import DenoiseEngine
+
+    weights = config["model_paths"].get(backend, config["weights"])
+    start = time.perf_counter()
+    engine = DenoiseEngine(weights, **BACKENDS[backend])
+    load_seconds = time.perf_counter() - start
+    if engine.precision != BACKENDS[backend].get("precision", "float32"):
+        print("{} failed the accuracy guard, skipped".format(backend))
+        return [], None
+
+    # batch_size different signals of each duration, denoised together as channels: the
+    # engine folds them into the batch dimension, one block of every signal per forward pass
+    signals = {(duration, batch_size): torch.cat([noisy_speech(duration, config["snr_db"], config["color"],
+                                                               config["seed"] + i) for i in range(batch_size)])
+               for duration in config["durations"] for batch_size in config["batch_sizes"]}
+    rows = []
+    for threads in config["threads"]:
+        torch.set_num_threads(threads)
+        for batch_size in config["batch_sizes"]:
+            engine.max_batch_size = batch_size
+            for duration in config["durations"]:
+                signal = signals[duration, batch_size]
+                for _ in range(config["warmup"]):
+                    engine.denoise(signal, SAMPLE_RATE)
+                latencies = []
+                for _ in range(config["repeats"]):
+                    start = time.perf_counter()
+                    engine.denoise(signal, SAMPLE_RATE)
+                    latencies.append(time.perf_counter() - start)
+
+                # throughput and rtf count the audio of every signal in the batch
+                median = float(np.median(latencies))
+                audio_seconds = batch_size * duration
+                row = {"backend": backend, "duration_s": duration, "batch_size": batch_size, "threads": threads,
+                       "latency_median_s": median, "latency_min_s": min(latencies),
+                       "latency_max_s": max(latencies), "throughput": audio_seconds / median,
+                       "rtf": median / audio_seconds}
+                print("{backend:<10}{duration_s:>8.1f} s  batch {batch_size:<3} threads {threads:<3}"
+                      "{latency_median_s:>9.3f} s  rtf {rtf:.3f}".format(**row), flush=True)
+                rows.append(row)
+    engine.close()
+
+    # ru_maxrss only ever grows within a process, so it is reported once per backend
+    return rows, {"load_s": load_seconds, "peak_rss_mb": peak_rss_mb()}
+
+
+def run(config, isolate=True):
+    rows = []
+    backends = {}
+    for backend in config["backends"]:
+        if backend in ("onnx", "int8") and backend not in config["model_paths"]:
+            print("{} needs --{}, skipped".format(backend, "onnx" if backend == "onnx" else "quantized"))
+            continue
+        if isolate:
+            # a fresh interpreter per backend, so peak RSS does not carry over
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                backend_rows, summary = pool.apply(run_backend, (backend, config))
+        else:
+            backend_rows, summary = run_backend(backend, config)
+        rows.extend(backend_rows)
+        if summary is not None:
+            backends[backend] = summary
+
+    return {
+        "config": config,
+        "environment": {"python": platform.python_version(), "torch": torch.__version__,
+                        "platform": platform.platform(), "processor": platform.processor(),
+                        "cpu_count": multiprocessing.cpu_count(), "default_threads": torch.get_num_threads()},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backends": backends,
+        "results": rows,
+    }
+
+
+def _key(row):
+    return row["backend"], row["duration_s"], row["batch_size"], row["threads"]
+
+
+def _change(reference, value):
+    if not reference or value is None:
+        return None
+    return value / reference - 1
+
+
+def compare(baseline, candidate, threshold=0.1, rss_threshold=None):
+    """
+    Relative latency change of every configuration in both files, and relative
+    peak RSS change of every backend in both. Returns (latency rows, rss rows,
+    regressions): a regression is a configuration whose latency grew by more
+    than `threshold`, or a backend whose peak RSS grew by more than `rss_threshold`.
+    """
+    rss_threshold = threshold if rss_threshold is None else rss_threshold
+    base = {_key(row): row for row in baseline["results"]}
+    latency_rows = []
+    for row in candidate["results"]:
+        if _key(row) in base:
+            change = _change(base[_key(row)]["latency_median_s"], row["latency_median_s"])
+            latency_rows.append({"key": _key(row), "change": change,
+                                 "regressed": change is not None and change > threshold})
+
+    rss_rows = []
+    base_backends = baseline.get("backends", {})
+    for backend, summary in candidate.get("backends", {}).items():
+        if backend in base_backends:
+            change = _change(base_backends[backend]["peak_rss_mb"], summary["peak_rss_mb"])
+            rss_rows.append({"key": backend, "change": change,
+                             "regressed": change is not None and change > rss_threshold})
+
+    regressions = [row for row in latency_rows + rss_rows if row["regressed"]]
+    return latency_rows, rss_rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    run_parser.add_argument("--onnx", help="model exported by onnx_backend.py, for the onnx backend")
+    run_parser.add_argument("--quantized", help="model written by quantization.py, for the int8 backend")
+    run_parser.add_argument("--durations", type=float, nargs="+", default=[1.0, 5.0, 20.0])
+    run_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    run_parser.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    run_parser.add_argument("--backends", nargs="+", default=["float32"], choices=list(BACKENDS))
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument("--snr-db", type=float, default=5.0)
+    run_parser.add_argument("--color", default="pink", choices=["white", "pink", "blue", "brown", "violet"])
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--no-isolate", action="store_true", help="run every backend in this process (peak RSS then accumulates)")
+    run_parser.add_argument("--out", required=True)
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="largest allowed relative latency increase")
+    compare_parser.add_argument("--rss-threshold", type=float, help="same for peak RSS, defaults to --threshold")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        model_paths = {}
+        if args.onnx:
+            model_paths["onnx"] = args.onnx
+        if args.quantized:
+            model_paths["int8"] = args.quantized
+        config = {"weights": args.weights, "model_paths": model_paths, "durations": args.durations,
+                  "batch_sizes": args.batch_sizes, "threads": args.threads, "backends": args.backends,
+                  "repeats": args.repeats, "warmup": args.warmup, "snr_db": args.snr_db, "color": args.color,
+                  "seed": args.seed}
+        report = run(config, isolate=not args.no_isolate)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved {} results to {}".format(len(report["results"]), args.out))
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        latency_rows, rss_rows, regressions = compare(baseline, candidate, args.threshold, args.rss_threshold)
+
+        def change(row):
+            return "{:+.1%}".format(row["change"]) if row["change"] is not None else "-"
+
+        fstring = "{:<10}{:>10}{:>8}{:>9}{:>12}  {}"
+        print(fstring.format("backend", "seconds", "batch", "threads", "latency", ""))
+        for row in latency_rows:
+            print(fstring.format(*row["key"], change(row), "REGRESSION" if row["regressed"] else ""))
+        if rss_rows:
+            print()
+            print("{:<10}{:>12}".format("backend", "peak RSS"))
+            for row in rss_rows:
+                print("{:<10}{:>12}  {}".format(row["key"], change(row), "REGRESSION" if row["regressed"] else ""))
+
+        if not latency_rows:
+            sys.exit("No configuration appears in both files")
+        if regressions:
+            print("{} of {} comparisons regressed beyond the threshold".format(
+                len(regressions), len(latency_rows) + len(rss_rows)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Content-addressed cache of /denoise results.
+
+Entries are keyed on a hash of the decoded PCM plus everything about the engine
+that changes the output (weights, STFT and chunking parameters) and evicted
+least-recently-used first once their total size passes `max_bytes`. An
+optional directory keeps results across restarts, bounded the same way.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def cache_key(waveform, sample_rate, engine_id):
+    """
+    Hex digest identifying the result of denoising `waveform` with a given engine.
+    """
+    digest = hashlib.sha256()
+    digest.update(engine_id.encode())
+    digest.update(str(sample_rate).encode())
+    waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+    digest.update(str(waveform.shape).encode())
+    digest.update(waveform.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache():
+    """
+    Thread-safe LRU cache of result bytes, bounded by total size.
+    """
+    def __init__(self, max_bytes, directory=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_bytes if max_disk_bytes is None else max_disk_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key, value)
+        self._disk_put(key, value)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        if self.directory is not None:
+            stats["disk_bytes"] = sum(size for _, size, _ in self._disk_entries())
+        return stats
+
+    def _insert(self, key, value):
+        # caller holds the lock
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def _disk_get(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            # mark as recently used for disk eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def _disk_put(self, key, value):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._disk_evict()
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _disk_evict(self):
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,523 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+SAMPLE_RATE = 48000
+N_FFT = (SAMPLE_RATE * 64) // 1000 
+HOP_LENGTH = (SAMPLE_RATE * 16) // 1000 
+
+
+
+def _pack(real, im, weight_dim):
+    """
+    Moves the weights of `real` and `im` into one tensor, concatenated along
+    `weight_dim`, and their biases into another, leaving the four parameters as
+    views of them. Returns (weight, bias).
+    """
+    weight = torch.cat([real.weight.detach(), im.weight.detach()], dim=weight_dim)
+    bias = torch.cat([real.bias.detach(), im.bias.detach()])
+    out_channels = real.weight.size(weight_dim)
+    real.weight = nn.Parameter(weight.narrow(weight_dim, 0, out_channels))
+    im.weight = nn.Parameter(weight.narrow(weight_dim, out_channels, out_channels))
+    real.bias = nn.Parameter(bias[:out_channels])
+    im.bias = nn.Parameter(bias[out_channels:])
+    return weight, bias
+
+
+def _packed_parameters(module, real, im, weight_dim):
+    """
+    `module._packed` while the parameters of `real` and `im` are still views of it,
+    else None. Once they are replaced (assigned from a memory-mapped checkpoint,
+    cast or moved) the packed tensors are dropped rather than kept as a second copy.
+    """
+    if module._packed is None:
+        return None
+    weight, bias = module._packed
+    out_channels = real.weight.size(weight_dim)
+    if (real.weight.data_ptr() == weight.data_ptr()
+            and im.weight.data_ptr() == weight.narrow(weight_dim, out_channels, out_channels).data_ptr()
+            and real.bias.data_ptr() == bias.data_ptr()
+            and im.bias.data_ptr() == bias[out_channels:].data_ptr()):
+        return module._packed
+    module._packed = None
+    return None
+
+
+def _fused_parameters(module, real, im, weight_dim):
+    """
+    Weights of `real` and `im` concatenated along `weight_dim`, and their biases:
+    without autograd the packed tensors the parameters are views of, otherwise
+    (training, or parameters no longer packed) concatenated for this call only.
+    """
+    packed = _packed_parameters(module, real, im, weight_dim)
+    if packed is not None and not torch.is_grad_enabled():
+        return packed
+    return torch.cat([real.weight, im.weight], dim=weight_dim), torch.cat([real.bias, im.bias])
+
+
+def _release_unpacked(module, incompatible_keys):
+    # load_state_dict post-hook: a checkpoint assigned instead of copied in unpacks the parameters
+    module._packed_parameters()
+
+
+def _watch_loads(module):
+    # no load_state_dict post-hooks before torch 1.13; the check then runs on the next forward
+    register = getattr(module, "register_load_state_dict_post_hook", None)
+    if register is not None:
+        register(_release_unpacked)
+
+
+class CConv2d(nn.Module):
+    """
+    Class of complex valued convolutional layer
+    """
+    def __init__(self, in_channels, out_channels, kernel_size, stride=1, padding=0):
+        super().__init__()
+        
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = kernel_size
+        self.padding = padding
+        self.stride = stride
+        
+        self.real_conv = nn.Conv2d(in_channels=self.in_channels, 
+                                   out_channels=self.out_channels, 
+                                   kernel_size=self.kernel_size, 
+                                   padding=self.padding, 
+                                   stride=self.stride)
+        
+        self.im_conv = nn.Conv2d(in_channels=self.in_channels, 
+                                 out_channels=self.out_channels, 
+                                 kernel_size=self.kernel_size, 
+                                 padding=self.padding, 
+                                 stride=self.stride)
+        
+        # Glorot initialization.
+        nn.init.xavier_uniform_(self.real_conv.weight)
+        nn.init.xavier_uniform_(self.im_conv.weight)
+        
+        # Both convolutions live in one [real; im] weight and bias, so the fused
+        # convolution needs no copy of them, see _pack.
+        self._packed = _pack(self.real_conv, self.im_conv, 0)
+        _watch_loads(self)
+        
+        
+    # Run the four real convolutions as a single one, see _fused_forward.
+    # Cleared when the convolutions are replaced (e.g. by quantization.py).
+    fused = True
+    
+    def _packed_parameters(self):
+        return _packed_parameters(self, self.real_conv, self.im_conv, 0)
+        
+    def forward(self, x):
+        if self.fused:
+            return self._fused_forward(x)
+        
+        x_real = x[..., 0]
+        x_im = x[..., 1]
+        
+        c_real = self.real_conv(x_real) - self.im_conv(x_im)
+        c_im = self.im_conv(x_real) + self.real_conv(x_im)
+        
+        output = torch.stack([c_real, c_im], dim=-1)
+        return output
+    
+    def _fused_forward(self, x):
+        # Real and imaginary parts are stacked along the batch and the real and
+        # imaginary kernels along the output channels, so one convolution yields
+        # W_r*x_r, W_i*x_r, W_r*x_i and W_i*x_i (each with its bias, as above).
+        # The input permute and the output stack are still copies in this
+        # (..., 2) layout; only DCUnet20Native (dcunet_native.py) avoids them.
+        n = x.size(0)
+        x = x.permute(4, 0, 1, 2, 3).reshape(2 * n, *x.shape[1:4])
+        
+        weight, bias = _fused_parameters(self, self.real_conv, self.im_conv, 0)
+        y = F.conv2d(x, weight, bias, stride=self.real_conv.stride, padding=self.real_conv.padding)
+        
+        real_x_real, im_x_real = y[:n].chunk(2, dim=1)
+        real_x_im, im_x_im = y[n:].chunk(2, dim=1)
+        
+        output = torch.stack([real_x_real - im_x_im, im_x_real + real_x_im], dim=-1)
+        return output
+    
+
+
+class CConvTranspose2d(nn.Module):
+    """
+      Class of complex valued dilation convolutional layer
+    """
+    def __init__(self, in_channels, out_channels, kernel_size, stride, output_padding=0, padding=0):
+        super().__init__()
+        
+        self.in_channels = in_channels
+
+        self.out_channels = out_channels
+        self.kernel_size = kernel_size
+        self.output_padding = output_padding
+        self.padding = padding
+        self.stride = stride
+        
+        self.real_convt = nn.ConvTranspose2d(in_channels=self.in_channels, 
+                                            out_channels=self.out_channels, 
+                                            kernel_size=self.kernel_size, 
+                                            output_padding=self.output_padding,
+                                            padding=self.padding,
+                                            stride=self.stride)
+        
+        self.im_convt = nn.ConvTranspose2d(in_channels=self.in_channels, 
+                                            out_channels=self.out_channels, 
+                                            kernel_size=self.kernel_size, 
+                                            output_padding=self.output_padding, 
+                                            padding=self.padding,
+                                            stride=self.stride)
+        
+        
+        # Glorot initialization.
+        nn.init.xavier_uniform_(self.real_convt.weight)
+        nn.init.xavier_uniform_(self.im_convt.weight)
+        
+        # see CConv2d._packed; transposed weights are (in, out, kh, kw)
+        self._packed = _pack(self.real_convt, self.im_convt, 1)
+        _watch_loads(self)
+        
+        
+    # see CConv2d.fused
+    fused = True
+    
+    def _packed_parameters(self):
+        return _packed_parameters(self, self.real_convt, self.im_convt, 1)
+        
+    def forward(self, x):
+        if self.fused:
+            return self._fused_forward(x)
+        
+        x_real = x[..., 0]
+        x_im = x[..., 1]
+        
+        ct_real = self.real_convt(x_real) - self.im_convt(x_im)
+        ct_im = self.im_convt(x_real) + self.real_convt(x_im)
+        
+        output = torch.stack([ct_real, ct_im], dim=-1)
+        return output
+    
+    def _fused_forward(self, x):
+        # Same layout as CConv2d._fused_forward; transposed weights are (in, out, kh, kw)
+        n = x.size(0)
+        x = x.permute(4, 0, 1, 2, 3).reshape(2 * n, *x.shape[1:4])
+        
+        weight, bias = _fused_parameters(self, self.real_convt, self.im_convt, 1)
+        y = F.conv_transpose2d(x, weight, bias, stride=self.real_convt.stride, padding=self.real_convt.padding,
+                               output_padding=self.real_convt.output_padding)
+        
+        real_x_real, im_x_real = y[:n].chunk(2, dim=1)
+        real_x_im, im_x_im = y[n:].chunk(2, dim=1)
+        
+        output = torch.stack([real_x_real - im_x_im, im_x_real + real_x_im], dim=-1)
+        return output
+    
+
+
+
+class CBatchNorm2d(nn.Module):
+    """
+    Class of complex valued batch normalization layer
+    """
+    def __init__(self, num_features, eps=1e-05, momentum=0.1, affine=True, track_running_stats=True):
+        super().__init__()
+        
+        self.num_features = num_features
+        self.eps = eps
+        self.momentum = momentum
+        self.affine = affine
+        self.track_running_stats = track_running_stats
+        
+        self.real_b = nn.BatchNorm2d(num_features=self.num_features, eps=self.eps, momentum=self.momentum,
+                                      affine=self.affine, track_running_stats=self.track_running_stats)
+        self.im_b = nn.BatchNorm2d(num_features=self.num_features, eps=self.eps, momentum=self.momentum,
+                                    affine=self.affine, track_running_stats=self.track_running_stats) 
+        
+    def forward(self, x):
+        x_real = x[..., 0]
+        x_im = x[..., 1]
+        
+        n_real = self.real_b(x_real)
+        n_im = self.im_b(x_im)  
+        
+        output = torch.stack([n_real, n_im], dim=-1)
+        return output
+    
+
+
+class Encoder(nn.Module):
+    """
+    Class of upsample block
+    """
+    def __init__(self, filter_size=(7,5), stride_size=(2,2), in_channels=1, out_channels=45, padding=(0,0)):
+        super().__init__()
+        
+        self.filter_size = filter_size
+        self.stride_size = stride_size
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.padding = padding
+
+        self.cconv = CConv2d(in_channels=self.in_channels, out_channels=self.out_channels, 
+                             kernel_size=self.filter_size, stride=self.stride_size, padding=self.padding)
+        
+        self.cbn = CBatchNorm2d(num_features=self.out_channels) 
+        
+        self.leaky_relu = nn.LeakyReLU()
+            
+    def forward(self, x):
+        
+        conved = self.cconv(x)
+        normed = self.cbn(conved)
+        acted = self.leaky_relu(normed)
+        
+        return acted
+    
+
+
+
+
+class Decoder(nn.Module):
+    """
+    Class of downsample block
+    """
+    def __init__(self, filter_size=(7,5), stride_size=(2,2), in_channels=1, out_channels=45,
+                 output_padding=(0,0), padding=(0,0), last_layer=False):
+        super().__init__()
+        
+        self.filter_size = filter_size
+        self.stride_size = stride_size
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.output_padding = output_padding
+        self.padding = padding
+        
+        self.last_layer = last_layer
+        
+        self.cconvt = CConvTranspose2d(in_channels=self.in_channels, out_channels=self.out_channels, 
+                             kernel_size=self.filter_size, stride=self.stride_size, output_padding=self.output_padding, padding=self.padding)
+        
+        self.cbn = CBatchNorm2d(num_features=self.out_channels) 
+        
+        self.leaky_relu = nn.LeakyReLU()
+            
+    def forward(self, x):
+        
+        conved = self.cconvt(x)
+        
+        if not self.last_layer:
+            normed = self.cbn(conved)
+            output = self.leaky_relu(normed)
+        else:
+            # the mask is computed in float32 even under reduced-precision autocast
+            conved = conved.float()
+            m_phase = conved / (torch.abs(conved) + 1e-8)
+            m_mag = torch.tanh(torch.abs(conved))
+            output = m_phase * m_mag
+            
+        return output
+    
+
+
+
+
+class DCUnet20(nn.Module):
+    """
+    Deep Complex U-Net class of the model.
+    """
+    def __init__(self, n_fft=64, hop_length=16):
+        super().__init__()
+        
+        # for istft
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        
+        self.set_size(model_complexity=int(45//1.414), input_channels=1, model_depth=20)
+        self.encoders = []
+        self.model_length = 20 // 2
+        
+        for i in range(self.model_length):
+            module = Encoder(in_channels=self.enc_channels[i], out_channels=self.enc_channels[i + 1],
+                             filter_size=self.enc_kernel_sizes[i], stride_size=self.enc_strides[i], padding=self.enc_paddings[i])
+            self.add_module("encoder{}".format(i), module)
+            self.encoders.append(module)
+
+        self.decoders = []
+
+        for i in range(self.model_length):
+            if i != self.model_length - 1:
+                module = Decoder(in_channels=self.dec_channels[i] + self.enc_channels[self.model_length - i], out_channels=self.dec_channels[i + 1], 
+                                 filter_size=self.dec_kernel_sizes[i], stride_size=self.dec_strides[i], padding=self.dec_paddings[i],
+                                 output_padding=self.dec_output_padding[i])
+            else:
+                module = Decoder(in_channels=self.dec_channels[i] + self.enc_channels[self.model_length - i], out_channels=self.dec_channels[i + 1], 
+                                 filter_size=self.dec_kernel_sizes[i], stride_size=self.dec_strides[i], padding=self.dec_paddings[i],
+                                 output_padding=self.dec_output_padding[i], last_layer=True)
+            self.add_module("decoder{}".format(i), module)
+            self.decoders.append(module)
+       
+        
+    def forward(self, x, is_istft=True):
+        # print('x : ', x.shape)
+        orig_x = x
+        xs = []
+        for i, encoder in enumerate(self.encoders):
+            xs.append(x)
+            x = encoder(x)
+            # print('Encoder : ', x.shape)
+            
+        p = x
+        for i, decoder in enumerate(self.decoders):
+            p = decoder(p)
+            if i == self.model_length - 1:
+                break
+            # print('Decoder : ', p.shape)
+            p = torch.cat([p, xs[self.model_length - 1 - i]], dim=1)
+        
+        # u9 - the mask
+        
+        mask = p
+        
+        # print('mask : ', mask.shape)
+        
+        output = mask * orig_x
+        output = torch.squeeze(output, 1)
+
+
+        if is_istft:
+            output = torch.istft(output, n_fft=self.n_fft, hop_length=self.hop_length, normalized=True)
+        
+        return output
+
+    
+    def fits_frames(self, frames):
+        """
+        Whether a spectrogram with `frames` time steps passes through the network:
+        every decoder output has to line up with its skip connection, and the last
+        one with the input spectrogram.
+        """
+        sizes = [frames]
+        for i in range(self.model_length):
+            kernel, stride, padding = self.enc_kernel_sizes[i][1], self.enc_strides[i][1], self.enc_paddings[i][1]
+            size = (sizes[-1] + 2 * padding - kernel) // stride + 1
+            if size < 1:
+                return False
+            sizes.append(size)
+        
+        size = sizes[-1]
+        for i in range(self.model_length):
+            kernel, stride, padding = self.dec_kernel_sizes[i][1], self.dec_strides[i][1], self.dec_paddings[i][1]
+            size = (size - 1) * stride - 2 * padding + kernel + self.dec_output_padding[i][1]
+            if size != sizes[self.model_length - 1 - i]:
+                return False
+        return True
+    
+    def set_size(self, model_complexity, model_depth=20, input_channels=1):
+
+        if model_depth == 20:
+            self.enc_channels = [input_channels,
+                                 model_complexity,
+                                 model_complexity,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 128]
+
+            self.enc_kernel_sizes = [(7, 1),
+                                     (1, 7),
+                                     (6, 4),
+                                     (7, 5),
+                                     (5, 3),
+                                     (5, 3),
+                                     (5, 3),
+                                     (5, 3),
+                                     (5, 3),
+                                     (5, 3)]
+
+            self.enc_strides = [(1, 1),
+                                (1, 1),
+                                (2, 2),
+                                (2, 1),
+                                (2, 2),
+                                (2, 1),
+                                (2, 2),
+                                (2, 1),
+                                (2, 2),
+                                (2, 1)]
+
+            self.enc_paddings = [(3, 0),
+                                 (0, 3),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0)]
+
+            self.dec_channels = [0,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity * 2,
+                                 model_complexity,
+                                 model_complexity,
+                                 1]
+
+            self.dec_kernel_sizes = [(6, 3), 
+                                     (6, 3),
+                                     (6, 3),
+                                     (6, 4),
+                                     (6, 3),
+                                     (6, 4),
+                                     (8, 5),
+                                     (7, 5),
+                                     (1, 7),
+                                     (7, 1)]
+
+            self.dec_strides = [(2, 1), #
+                                (2, 2), #
+                                (2, 1), #
+                                (2, 2), #
+                                (2, 1), #
+                                (2, 2), #
+                                (2, 1), #
+                                (2, 2), #
+                                (1, 1),
+                                (1, 1)]
+
+            self.dec_paddings = [(0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 0),
+                                 (0, 3),
+                                 (3, 0)]
+            
+            self.dec_output_padding = [(0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0),
+                                       (0,0)]
+        else:
+            raise ValueError("Unknown model depth : {}".format(model_depth))
@@ -0,0 +1,171 @@
+"""
+DCUnet20 on native complex spectrograms with a contiguous channel-split layout.
+
+DCUnet20 carries complex tensors as (batch, channels, freq, frames, 2) and
+every layer slices and re-stacks the trailing dimension. DCUnet20Native takes
+the complex output of `torch.stft(..., return_complex=True)` and works on real
+(batch, 2 * channels, freq, frames) tensors holding [real; imag] channels, so
+each layer is a single ordinary convolution with no slicing or stacking, and
+the masked spectrogram goes back to complex for `torch.istft`.
+
+Models are converted from DCUnet20 (and so from existing checkpoints) with
+`DCUnet20Native.from_dcunet20` or `load_native`; training stays on DCUnet20.
+"""
+import torch
+import torch.nn as nn
+
+from dcunet import N_FFT, HOP_LENGTH, DCUnet20
+from optimize import fold_complex_conv
+
+
+class NativeEncoder(nn.Module):
+    """
+    Encoder block on channel-split tensors.
+    """
+    def __init__(self, conv, bn):
+        super().__init__()
+        self.conv = conv
+        self.bn = bn
+        self.leaky_relu = nn.LeakyReLU()
+
+    def forward(self, x):
+        return self.leaky_relu(self.bn(self.conv(x)))
+
+
+class NativeDecoder(nn.Module):
+    """
+    Decoder block on channel-split tensors; the last one produces the mask.
+    """
+    def __init__(self, conv, bn, last_layer=False):
+        super().__init__()
+        self.conv = conv
+        self.bn = bn
+        self.leaky_relu = nn.LeakyReLU()
+        self.last_layer = last_layer
+
+    def forward(self, x):
+        conved = self.conv(x)
+
+        if not self.last_layer:
+            output = self.leaky_relu(self.bn(conved))
+        else:
+            # the mask is computed in float32 even under reduced-precision autocast
+            conved = conved.float()
+            m_phase = conved / (torch.abs(conved) + 1e-8)
+            m_mag = torch.tanh(torch.abs(conved))
+            output = m_phase * m_mag
+
+        return output
+
+
+def _merge_batchnorm(cbn):
+    # one BatchNorm2d over [real; imag] channels is the same as the real/imag pair
+    bn = nn.BatchNorm2d(2 * cbn.num_features, eps=cbn.eps, momentum=cbn.momentum,
+                        affine=cbn.affine, track_running_stats=cbn.track_running_stats)
+    state = {}
+    for key, value in cbn.real_b.state_dict().items():
+        other = cbn.im_b.state_dict()[key]
+        state[key] = torch.cat([value, other]) if value.dim() else value
+    bn.load_state_dict(state)
+    return bn
+
+
+def _reorder_skip_inputs(conv, skip_channels):
+    """
+    The folded weights expect [p_r, x_r, p_i, x_i] input channels for the decoder
+    input cat([p, x]) of DCUnet20. Permuting them once lets the native model use
+    cat([p, x]) = [p_r, p_i, x_r, x_i] directly.
+    """
+    in_channels = conv.in_channels // 2
+    p = in_channels - skip_channels
+    perm = (list(range(0, p)) + list(range(in_channels, in_channels + p)) +
+            list(range(p, in_channels)) + list(range(in_channels + p, 2 * in_channels)))
+    perm = torch.tensor(perm)
+    with torch.no_grad():
+        if isinstance(conv, nn.ConvTranspose2d):
+            conv.weight.copy_(conv.weight[perm])
+        else:
+            conv.weight.copy_(conv.weight[:, perm])
+    return conv
+
+
+class DCUnet20Native(nn.Module):
+    """
+    Deep Complex U-Net on complex spectrograms, converted from a DCUnet20.
+    """
+    def __init__(self, encoders, decoders, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        super().__init__()
+
+        # for istft
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+        self.encoders = nn.ModuleList(encoders)
+        self.decoders = nn.ModuleList(decoders)
+        self.model_length = len(self.encoders)
+
+    @classmethod
+    def from_dcunet20(cls, model, fold_batchnorm=True):
+        """
+        Converts an eval-mode DCUnet20. With `fold_batchnorm` the batch norms are
+        folded into the convolutions (see optimize.py), otherwise they are kept as
+        single BatchNorm2d layers over the split channels.
+        """
+        encoders = []
+        for encoder in model.encoders:
+            if fold_batchnorm:
+                conv, bn = fold_complex_conv(encoder.cconv, encoder.cbn).conv, nn.Identity()
+            else:
+                conv, bn = fold_complex_conv(encoder.cconv).conv, _merge_batchnorm(encoder.cbn)
+            encoders.append(NativeEncoder(conv, bn))
+
+        decoders = []
+        for i, decoder in enumerate(model.decoders):
+            if fold_batchnorm or decoder.last_layer:
+                cbn = None if decoder.last_layer else decoder.cbn
+                conv, bn = fold_complex_conv(decoder.cconvt, cbn).conv, nn.Identity()
+            else:
+                conv, bn = fold_complex_conv(decoder.cconvt).conv, _merge_batchnorm(decoder.cbn)
+            skip_channels = model.enc_channels[model.model_length - i] if i > 0 else 0
+            conv = _reorder_skip_inputs(conv, skip_channels)
+            decoders.append(NativeDecoder(conv, bn, decoder.last_layer))
+
+        native = cls(encoders, decoders, model.n_fft, model.hop_length)
+        return native.to(next(model.parameters()).device).eval()
+
+    def forward(self, x, is_istft=True):
+        # x : complex (batch, 1, freq, frames)
+        orig_x = torch.cat([x.real, x.imag], dim=1)
+        x = orig_x
+        xs = []
+        for encoder in self.encoders:
+            xs.append(x)
+            x = encoder(x)
+
+        p = x
+        for i, decoder in enumerate(self.decoders):
+            p = decoder(p)
+            if i == self.model_length - 1:
+                break
+            p = torch.cat([p, xs[self.model_length - 1 - i]], dim=1)
+
+        # u9 - the mask
+        mask = p
+
+        output = mask * orig_x
+        output = torch.complex(output[:, 0], output[:, 1])
+
+        if is_istft:
+            output = torch.istft(output, n_fft=self.n_fft, hop_length=self.hop_length, normalized=True)
+
+        return output
+
+
+def load_native(weights_path, device="cpu", fold_batchnorm=True):
+    """
+    Loads a DCUnet20 checkpoint and converts it to DCUnet20Native.
+    """
+    model = DCUnet20(N_FFT, HOP_LENGTH)
+    model.load_state_dict(torch.load(weights_path, map_location=torch.device('cpu')))
+    model.eval()
+    return DCUnet20Native.from_dcunet20(model, fold_batchnorm).to(device)
@@ -0,0 +1,97 @@
+"""
+Cold-start budget for the inference modules.
+
+Imports each module in a fresh interpreter under `python -X importtime`, checks
+that none of the training/evaluation dependencies were pulled in and that the
+cumulative import time stays within the budget. Exits non-zero on a violation,
+so it can run in CI or before building a serving image.
+
+    python importtime_budget.py
+    python importtime_budget.py --budget-ms 3000 --module inference --module MODEL
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that must stay out of a plain `import inference`
+FORBIDDEN = ("torchaudio", "matplotlib", "IPython", "tqdm", "pypesq", "pystoi", "numba", "scipy",
+             "metrics", "noise_addition_utils", "flask", "onnxruntime")
+
+DEFAULT_MODULES = ("dcunet", "inference", "MODEL")
+
+# Cumulative import time allowed per module, torch included
+DEFAULT_BUDGET_MS = float(os.environ.get("DENOISE_IMPORT_BUDGET_MS", 5000))
+
+_CHECK = """
+import sys
+import {module}
+print(",".join(sorted(name for name in {forbidden!r} if name in sys.modules)))
+"""
+
+
+def measure(module, cwd=None):
+    """
+    Imports `module` in a fresh interpreter. Returns the cumulative import time in
+    milliseconds, the slowest imports directly below the top level and the
+    forbidden modules it loaded.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             _CHECK.format(module=module, forbidden=FORBIDDEN)],
+                            cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError("import {} failed: {}".format(module, result.stderr.strip().splitlines()[-1]))
+
+    # lines are "import time: self [us] | cumulative | imported package",
+    # nested imports are indented by two spaces per level
+    total_ms = 0.0
+    nested = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        ms = int(cumulative) / 1000
+        if depth == 0:
+            total_ms += ms
+        elif depth == 1:
+            nested.append((ms, name.strip()))
+
+    slowest = sorted(nested, reverse=True)[:5]
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return total_ms, slowest, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="module to check (default: {})".format(
+        ", ".join(DEFAULT_MODULES)))
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    failed = False
+    for module in args.module or DEFAULT_MODULES:
+        try:
+            total_ms, slowest, loaded = measure(module, cwd)
+        except RuntimeError as e:
+            print("{:<12} {}".format(module, e))
+            failed = True
+            continue
+        ok = total_ms <= args.budget_ms and not loaded
+        failed |= not ok
+
+        print("{:<12}{:>10.0f} ms  {}".format(module, total_ms, "ok" if ok else "FAILED"))
+        for ms, name in slowest:
+            print("    {:>10.0f} ms  {}".format(ms, name))
+        if loaded:
+            print("    imports training/evaluation dependencies: {}".format(", ".join(loaded)))
+
+    if failed:
+        print("Cold-start check failed (budget {:.0f} ms)".format(args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
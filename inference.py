@@ -0,0 +1,424 @@
+"""
+Resident inference engine for the DCUnet20 denoiser.
+
+The model is built and its weights loaded once, then kept in eval mode so a
+server can call `denoise` for every request instead of spawning MODEL.py.
+"""
+import contextlib
+import hashlib
+import threading
+
+import torch
+import torch.nn.functional as F
+
+import telemetry
+from dcunet import SAMPLE_RATE, N_FFT, HOP_LENGTH, DCUnet20
+
+
+DEFAULT_WEIGHTS = "Pretrained_Weights/Noise2Noise/mixed.pth"
+
+# Length (in samples) of the blocks the model was trained on
+MAX_LEN = 165000
+
+# torch.inference_mode only exists from torch 1.9 onwards
+_inference_mode = getattr(torch, "inference_mode", torch.no_grad)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint on the CPU, memory-mapped where possible so the weights are
+    read lazily from the page cache and shared between processes loading the same file.
+
+    .safetensors files need the safetensors package; .pth files are mapped with
+    `torch.load(mmap=True)` on torch versions that support it and read normally otherwise.
+    """
+    if str(path).endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(str(path), device="cpu")
+
+    try:
+        return torch.load(path, map_location=torch.device('cpu'), mmap=True)
+    except (TypeError, RuntimeError):
+        # no mmap argument before torch 2.1, and legacy (non-zip) checkpoints cannot be mapped
+        return torch.load(path, map_location=torch.device('cpu'))
+
+
+def _load_state_dict(model, state_dict):
+    try:
+        # keep the (mapped) checkpoint tensors instead of copying them into fresh parameters
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        # no assign argument before torch 2.1
+        model.load_state_dict(state_dict)
+
+
+def _file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Progress():
+    """
+    Counts denoised blocks across forward passes and reports (done, total) to a callback.
+    """
+    def __init__(self, callback):
+        self.callback = callback
+        self.done = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+        self.callback(self.done, total)
+
+    def advance(self, n):
+        with self._lock:
+            self.done += n
+            done, total = self.done, self.total
+        self.callback(done, total)
+
+
+class DenoiseEngine():
+    """
+    Keeps one DCUnet20 in memory and denoises waveforms with it.
+    """
+    def __init__(self, weights_path=DEFAULT_WEIGHTS, device="cpu", max_batch_size=4, onnx_threads=None,
+                 optimize=False, native=False, vad=None, precision="float32"):
+        self.weights_path = weights_path
+        self.device = torch.device(device)
+
+        # upper bound on blocks per forward pass, to bound peak memory
+        self.max_batch_size = max_batch_size
+
+        # stft parameters
+        self.n_fft = N_FFT
+        self.hop_length = HOP_LENGTH
+
+        # fixed len
+        self.max_len = MAX_LEN
+
+        # optional MicroBatcher shared by concurrent callers, see start_batching
+        self.batcher = None
+
+        # set when batch norm has been folded into the convolutions
+        self.optimized = False
+
+        # set when the model takes complex spectrograms (DCUnet20Native)
+        self.native = False
+
+        # optional vad.VoiceActivityGate, silent stretches then skip the model
+        self.vad = vad
+
+        # autocast precision of the convolutions, see precision.py
+        self.precision = "float32"
+        self.precision_snr_db = None
+
+        quantized = False
+        if str(weights_path).endswith(".onnx"):
+            # mask network exported by onnx_backend.py, run with ONNX Runtime on CPU
+            from onnx_backend import OnnxModel
+            self.model = OnnxModel(weights_path, onnx_threads)
+        else:
+            checkpoint_path = weights_path
+            if native or optimize:
+                # a folded checkpoint saved by optimize.py is mapped as is instead of folding a copy
+                from optimize import find_folded
+                checkpoint_path = find_folded(weights_path, "native" if native else "optimize") or weights_path
+            checkpoint = load_checkpoint(checkpoint_path)
+            quantized = isinstance(checkpoint, dict) and checkpoint.get("quantized") is True
+            folded = checkpoint.get("folded") if isinstance(checkpoint, dict) else None
+            if quantized:
+                # INT8 model written by quantization.py, CPU only
+                from quantization import load_quantized
+                self.model = load_quantized(checkpoint)
+            elif folded:
+                from optimize import load_folded
+                self.model = load_folded(checkpoint).to(self.device)
+                self.native = folded == "native"
+                self.optimized = True
+            else:
+                self.model = DCUnet20(self.n_fft, self.hop_length)
+                _load_state_dict(self.model, checkpoint)
+                self.model.to(self.device).eval()
+                if native:
+                    # channel-split layout, batch norm always folded
+                    from dcunet_native import DCUnet20Native
+                    self.model = DCUnet20Native.from_dcunet20(self.model)
+                    self.native = True
+                    self.optimized = True
+                elif optimize:
+                    from optimize import optimize_for_inference
+                    self.model = optimize_for_inference(self.model)
+                    self.optimized = True
+        self.model.eval()
+        self.weights_id = _file_digest(weights_path)
+
+        # STFT lengths the network accepts only depend on the architecture
+        architecture = self.model if isinstance(self.model, DCUnet20) else DCUnet20(self.n_fft, self.hop_length)
+        max_frames = 1 + 4 * self.max_len // self.hop_length
+        self.valid_frames = [frames for frames in range(1, max_frames + 1) if architecture.fits_frames(frames)]
+
+        if precision != "float32":
+            from precision import check_supported, accuracy_guard
+            if str(weights_path).endswith(".onnx") or quantized:
+                raise ValueError("{} inference is only available for float checkpoints".format(precision))
+            check_supported(self.device, precision)
+            self.precision = precision
+            # falls back to float32 if the output drifts too far from it
+            self.precision_snr_db = accuracy_guard(self)
+
+    def identity(self):
+        """
+        String that changes whenever the engine would produce different output
+        for the same input, used to key cached results.
+        """
+        parts = [self.weights_id[:16], self.n_fft, self.hop_length, self.max_len, "adaptive"]
+        if self.optimized:
+            parts.append("folded")
+        if self.native:
+            parts.append("native")
+        if self.vad is not None:
+            parts.append(self.vad.identity())
+        if self.precision != "float32":
+            parts.append(self.precision)
+        return ":".join(str(part) for part in parts)
+
+    def valid_length(self, length):
+        """
+        Shortest length >= `length` samples whose spectrogram fits the network's
+        encoder/decoder stride arithmetic.
+        """
+        frames = 1 + length // self.hop_length
+        for valid in self.valid_frames:
+            if valid == frames:
+                return length
+            if valid > frames:
+                return (valid - 1) * self.hop_length
+        raise ValueError("No valid input length for {} samples".format(length))
+
+    def stft(self, x):
+        """
+        (batch, samples) waveform -> complex (batch, freq, frames) spectrogram, as in SpeechDataset.
+        """
+        return torch.stft(input=x, n_fft=self.n_fft, hop_length=self.hop_length,
+                          normalized=True, return_complex=True)
+
+    def istft(self, spec, length):
+        """
+        Inverse of `stft`, trimmed/padded to exactly `length` samples.
+        """
+        return torch.istft(spec, n_fft=self.n_fft, hop_length=self.hop_length,
+                           normalized=True, length=length)
+
+    def start_batching(self, max_batch_size=8, max_wait_ms=10):
+        """
+        Routes `denoise` through a MicroBatcher so blocks from concurrent calls
+        share forward passes.
+        """
+        from batching import MicroBatcher
+
+        if self.batcher is None:
+            self.batcher = MicroBatcher(self, max_batch_size, max_wait_ms)
+        return self.batcher
+
+    def close(self):
+        batcher, self.batcher = self.batcher, None
+        if batcher is not None:
+            batcher.close()
+
+    def queued_blocks(self):
+        """
+        Blocks waiting in the MicroBatcher, 0 without one.
+        """
+        batcher = self.batcher
+        return batcher.qsize() if batcher is not None else 0
+
+    def denoise_chunks(self, chunks):
+        """
+        Runs the model on a (batch, samples) tensor of waveform blocks of a valid length.
+        """
+        with telemetry.span("stft"):
+            x_noisy_stft = self.stft(chunks).unsqueeze(1)
+        with telemetry.span("forward"), self._autocast():
+            if self.native:
+                x_est_stft = self.model(x_noisy_stft, is_istft=False)
+            else:
+                # DCUnet20 (and its ONNX/INT8 variants) use the stacked real/imag layout
+                x_est_stft = self.model(torch.view_as_real(x_noisy_stft), is_istft=False)
+        if not self.native:
+            x_est_stft = torch.view_as_complex(x_est_stft.float().contiguous())
+        with telemetry.span("istft"):
+            return self.istft(x_est_stft, chunks.size(-1))
+
+    def _autocast(self):
+        if self.precision == "float32":
+            return contextlib.nullcontext()
+        from precision import autocast
+        return autocast(self.device, self.precision)
+
+    def _block_count(self, length):
+        # forward-pass blocks per channel for a signal of `length` samples, see _split_blocks
+        n_full, rem = divmod(length, self.max_len)
+        return n_full + (1 if rem else 0)
+
+    def _split_blocks(self, x):
+        """
+        Splits a (channels, samples) waveform into the (blocks, samples) tensors of
+        its forward passes, in time order. Returns a list of (piece, pad) pairs.
+
+        The leading remainder is padded on the left (like SpeechDataset) only up
+        to the nearest length the network accepts, then come the full blocks.
+        Channels are folded into the batch dimension time-major, so every piece
+        holds all channels of its blocks and at most max_batch_size blocks
+        (at least one per channel).
+        """
+        channels, current_len = x.shape
+        n_full, rem = divmod(current_len, self.max_len)
+        pieces = []
+        if rem:
+            pad = self.valid_length(rem) - rem
+            pieces.append((F.pad(x[:, :rem], (pad, 0)), pad))
+        if n_full:
+            blocks = x[:, rem:].reshape(channels, n_full, self.max_len).transpose(0, 1)
+            blocks = blocks.reshape(n_full * channels, self.max_len)
+            step = max(1, self.max_batch_size // channels) * channels
+            pieces.extend((batch, 0) for batch in blocks.split(step, dim=0))
+        return pieces
+
+    def _iter_blocks(self, x, progress=None):
+        """
+        Denoises a (channels, samples) waveform at SAMPLE_RATE with the model,
+        yielding the (channels, samples) output of each forward pass in time order.
+        """
+        channels = x.size(0)
+        pieces = self._split_blocks(x)
+
+        # with a batcher every piece is queued at once (and batched with whatever
+        # other requests are in flight), then picked up in order as it completes
+        # read once: close() may clear it from another thread (e.g. ModelRegistry eviction)
+        batcher = self.batcher
+        futures = None
+        if batcher is not None:
+            try:
+                futures = [batcher.submit(piece) for piece, _ in pieces]
+            except RuntimeError:
+                # closed meanwhile (e.g. evicted from a ModelRegistry), run the pieces directly
+                futures = None
+            if futures is not None and progress is not None:
+                for (piece, _), future in zip(pieces, futures):
+                    future.add_done_callback(lambda _, n=piece.size(0): progress.advance(n))
+
+        for i, (piece, pad) in enumerate(pieces):
+            if futures is not None:
+                out = futures[i].result()
+            else:
+                with _inference_mode():
+                    out = self.denoise_chunks(piece)
+                if progress is not None:
+                    progress.advance(piece.size(0))
+            out = out.reshape(-1, channels, out.size(-1)).transpose(0, 1).reshape(channels, -1)
+            yield out[:, pad:].cpu()
+
+    def _gated_regions(self, x):
+        """
+        (start, end, lo, hi) of every active region, where lo..hi extends start..end
+        by the cross-fade. The same regions apply to every channel, active when any
+        channel is.
+        """
+        current_len = x.size(1)
+        fade = int(SAMPLE_RATE * self.vad.fade_ms / 1000)
+        regions = []
+        position = 0
+        for start, end in self.vad.active_regions(x.cpu(), SAMPLE_RATE):
+            lo, hi = max(position, start - fade), min(current_len, end + fade)
+            regions.append((start, end, lo, hi))
+            position = hi
+        return regions
+
+    def _iter_gated(self, x, regions, progress=None):
+        """
+        Like `_iter_blocks`, but only the active `regions` go through the model;
+        the rest is attenuated passthrough, cross-faded in at each region boundary.
+        Yields the passthrough before each region, then the region itself.
+        """
+        position = 0
+        for start, end, lo, hi in regions:
+            if lo > position:
+                yield (x[:, position:lo] * self.vad.silence_gain).cpu()
+
+            denoised = torch.cat(list(self._iter_blocks(x[:, lo:hi], progress)), dim=1).to(x.device)
+            weight = torch.ones(hi - lo, device=x.device)
+            if start > lo:
+                weight[:start - lo] = torch.linspace(0, 1, start - lo, device=x.device)
+            if hi > end:
+                weight[end - lo:] = torch.linspace(1, 0, hi - end, device=x.device)
+            yield (x[:, lo:hi] * self.vad.silence_gain * (1 - weight) + denoised * weight).cpu()
+            position = hi
+
+        if position < x.size(1):
+            yield (x[:, position:] * self.vad.silence_gain).cpu()
+
+    def _prepare(self, waveform, sr):
+        # (channels, samples) float32 tensor at SAMPLE_RATE
+        waveform = torch.as_tensor(waveform, dtype=torch.float32)
+        if waveform.dim() == 1:
+            waveform = waveform.unsqueeze(0)
+
+        if sr != SAMPLE_RATE:
+            # imported here so that importing the engine only costs torch
+            from resampling import resample
+            with telemetry.span("resample"):
+                waveform = torch.from_numpy(resample(waveform.numpy(), sr, SAMPLE_RATE, axis=-1))
+        return waveform
+
+    def iter_denoise(self, waveform, sr, stats=None, progress=None):
+        """
+        Denoises a (channels, samples) or (samples,) waveform sampled at `sr`.
+        Returns an iterator over consecutive (channels, samples) pieces of the
+        output at SAMPLE_RATE, each available as soon as the forward pass
+        producing it finishes, so callers can start sending audio after the
+        first block.
+
+        Every channel is denoised in the same batched forward passes. If a
+        `stats` dict is given it receives, before this returns, the number of
+        samples (per channel) and how many of them skip the model through voice
+        activity gating. `progress(done, total)` is called with the number of
+        blocks denoised so far as forward passes finish.
+        """
+        waveform = self._prepare(waveform, sr)
+        channels, current_len = waveform.shape
+        tracker = _Progress(progress) if progress is not None else None
+        x = waveform.to(self.device)
+
+        if current_len == 0:
+            regions = []
+        elif self.vad is None:
+            regions = [(0, current_len, 0, current_len)]
+        else:
+            regions = self._gated_regions(x)
+        skipped = current_len - sum(hi - lo for _, _, lo, hi in regions)
+
+        if stats is not None:
+            stats["samples"] = current_len
+            stats["skipped_samples"] = skipped
+            stats["skipped_fraction"] = skipped / current_len if current_len else 0.0
+        if tracker is not None:
+            tracker.set_total(channels * sum(self._block_count(hi - lo) for _, _, lo, hi in regions))
+
+        if current_len == 0:
+            return iter([waveform])
+        if self.vad is None:
+            return self._iter_blocks(x, tracker)
+        return self._iter_gated(x, regions, tracker)
+
+    def denoise(self, waveform, sr, stats=None, progress=None):
+        """
+        Denoises a (channels, samples) or (samples,) waveform sampled at `sr` and
+        returns the (channels, samples) output at SAMPLE_RATE; see `iter_denoise`
+        for `stats` and `progress`.
+        """
+        return torch.cat(list(self.iter_denoise(waveform, sr, stats, progress)), dim=1)
@@ -0,0 +1,200 @@
+"""
+Background denoising jobs for recordings too long to process within one HTTP request.
+
+A job is submitted with its upload and returns an id at once; a dedicated
+executor runs it and records progress in forward-pass blocks, from which the
+status reports an estimated time remaining. The number of jobs kept and the
+bytes they hold (queued uploads, the audio of running jobs and finished
+results) are bounded: finished jobs are dropped oldest first, after `ttl`
+seconds or when room is needed for a new job, a running job's audio or a
+result. A job whose audio or result still does not fit fails.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class Job():
+    """
+    State of one job. `data` holds the upload until the job starts, `reserved` the
+    bytes set aside for it while it runs and `result` the output once done.
+    """
+    def __init__(self, data):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.data = data
+        self.reserved = 0
+        self.result = None
+        self.error = None
+
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+        # forward-pass blocks, see DenoiseEngine.denoise
+        self.chunks_done = 0
+        self.chunks_total = None
+        # extra fields returned by the job function, e.g. the fraction skipped by VAD
+        self.info = {}
+
+    @property
+    def nbytes(self):
+        return len(self.data or b"") + self.reserved + len(self.result or b"")
+
+    def progress(self, done, total):
+        self.chunks_done = done
+        self.chunks_total = total
+
+    def eta(self):
+        """
+        Estimated seconds until the job finishes, None while unknown.
+        """
+        if self.status == "done":
+            return 0.0
+        if self.status != "running" or not self.chunks_total or not self.chunks_done:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.chunks_done * (self.chunks_total - self.chunks_done)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "progress": self.chunks_done / self.chunks_total if self.chunks_total else None,
+            "eta_seconds": self.eta(),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            **self.info,
+        }
+
+
+class JobManager():
+    """
+    Runs jobs on `workers` threads, keeping at most `max_jobs` jobs and `max_bytes`
+    of uploads, running audio and results. `submit` raises JobLimitError when
+    neither bound can be met by dropping finished jobs.
+    """
+    def __init__(self, workers=1, max_jobs=64, max_bytes=512 * 2 ** 20, ttl=3600):
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="denoise-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _held_bytes(self):
+        return sum(job.nbytes for job in self._jobs.values())
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+
+    def _fits(self, nbytes, new_jobs):
+        return len(self._jobs) + new_jobs <= self.max_jobs and self._held_bytes() + nbytes <= self.max_bytes
+
+    def _make_room(self, nbytes, new_jobs=1):
+        # drop finished jobs, oldest first, until `nbytes` more (and `new_jobs` more jobs) fit
+        for job_id, job in list(self._jobs.items()):
+            if self._fits(nbytes, new_jobs):
+                return True
+            if job.finished is not None:
+                del self._jobs[job_id]
+        return self._fits(nbytes, new_jobs)
+
+    def _reserve(self, job, nbytes):
+        with self._lock:
+            job.reserved = 0
+            if not self._make_room(nbytes, 0):
+                raise JobLimitError("Not enough job memory for this recording, try again later")
+            job.reserved = nbytes
+
+    def submit(self, function, data, *args):
+        """
+        Queues `function(data, *args, progress=job.progress, reserve=...)`, which
+        returns the result bytes, optionally with a dict of extra status fields.
+        `reserve(nbytes)` sets aside the memory the job needs besides its upload
+        (e.g. the decoded audio) and raises JobLimitError when it does not fit.
+        Returns the job.
+        """
+        job = Job(data)
+        with self._lock:
+            self._expire()
+            if not self._make_room(job.nbytes):
+                raise JobLimitError("Too many jobs in progress, try again later")
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, function, args)
+        return job
+
+    def _run(self, job, function, args):
+        with self._lock:
+            if job.status == "cancelled":
+                return
+            job.status = "running"
+            job.started = time.time()
+            data, job.data = job.data, None
+            # the upload stays in memory until the function returns
+            job.reserved = len(data)
+
+        def reserve(nbytes):
+            self._reserve(job, len(data) + nbytes)
+
+        try:
+            result = function(data, *args, progress=job.progress, reserve=reserve)
+            if isinstance(result, tuple):
+                result, job.info = result
+        except Exception as e:
+            result = None
+            job.error = str(e)
+
+        with self._lock:
+            job.reserved = 0
+            if result is not None and not self._make_room(len(result), 0):
+                result = None
+                job.error = "Result too large for the job memory limit"
+            job.result = result
+            job.status = "failed" if result is None else "done"
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def delete(self, job_id):
+        """
+        Drops a job and its result. Queued jobs are cancelled, running ones finish
+        in the background. Returns False for unknown ids.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.data = None
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"jobs": counts, "bytes": self._held_bytes(),
+                    "max_jobs": self.max_jobs, "max_bytes": self.max_bytes}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,62 @@
+"""
+Local test client for the /jobs API in server.py.
+
+Submits an audio file as a job, polls its progress until it finishes and
+downloads the denoised WAV.
+
+    python jobs_client.py Samples/noisy.wav Samples/denoised.wav --url http://localhost:5000
+"""
+import argparse
+import sys
+import time
+
+import requests
+
+
+def run(args):
+    with open(args.input, "rb") as f:
+        data = {"model": args.model} if args.model else {}
+        response = requests.post(args.url + "/jobs", files={"audio": f}, data=data)
+    if response.status_code != 202:
+        sys.exit("Submit failed ({}): {}".format(response.status_code, response.text))
+    job = response.json()
+    print("Job {}".format(job["id"]))
+
+    start = time.perf_counter()
+    while True:
+        status = requests.get(args.url + job["status_url"]).json()
+        eta = status["eta_seconds"]
+        print("\r{:<8} {}/{} chunks  eta {}".format(
+            status["status"], status["chunks_done"], status["chunks_total"] or "?",
+            "{:.1f} s".format(eta) if eta is not None else "?"), end="", flush=True)
+        if status["status"] in ("done", "failed"):
+            break
+        time.sleep(args.poll)
+    print()
+
+    if status["status"] == "failed":
+        sys.exit("Job failed: {}".format(status["error"]))
+
+    response = requests.get(args.url + job["result_url"])
+    response.raise_for_status()
+    with open(args.output, "wb") as f:
+        f.write(response.content)
+    print("Saved {} bytes to {} after {:.1f} s".format(len(response.content), args.output,
+                                                       time.perf_counter() - start))
+    if not args.keep:
+        requests.delete(args.url + job["status_url"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--model", help="registry model name, see /status")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between status requests")
+    parser.add_argument("--keep", action="store_true", help="keep the job on the server after downloading")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
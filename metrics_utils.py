@@ -1,13 +1,15 @@
 
 
 from scipy.linalg import solve_toeplitz,toeplitz
-from scipy import interpolate
-from scipy.signal import stft,get_window,correlate,resample
+from scipy.signal import stft,get_window,correlate
 import numpy as np
 import pesq as pypesq
 from numba import jit
 import copy
 
+# Polyphase resampling with cached filters
+from resampling import resample
+
 # Main Sources/References:
 # https://github.com/schmiph2/pysepm
 
@@ -15,17 +17,6 @@ import copy
 class AudioMetricException(Exception):
     pass
 
-def resample(original, old_rate, new_rate):
-    if old_rate != new_rate:
-        duration = original.shape[0] / old_rate
-        time_old  = np.linspace(0, duration, original.shape[0])
-        time_new  = np.linspace(0, duration, int(original.shape[0] * new_rate / old_rate))
-        interpolator = interpolate.interp1d(time_old, original.T)
-        new_audio = interpolator(time_new).T
-        return new_audio
-    else:
-        return original
-
 def extract_overlapped_windows(x,nperseg,noverlap,window=None):
     step = nperseg - noverlap
     shape = x.shape[:-1]+((x.shape[-1]-noverlap)//step, nperseg)
@@ -0,0 +1,91 @@
+"""
+ONNX export of the DCUnet20 mask network and an ONNX Runtime inference backend.
+
+Only the network is exported: it takes the stacked (batch, 1, freq, frames, 2)
+noisy spectrogram and returns the masked (batch, freq, frames, 2) spectrogram,
+with dynamic batch and frame axes. STFT and iSTFT stay in DenoiseEngine.
+
+    python onnx_backend.py --weights Pretrained_Weights/Noise2Noise/mixed.pth --out Pretrained_Weights/Noise2Noise/mixed.onnx
+
+Pointing DenoiseEngine (or the server's DENOISE_WEIGHTS) at the .onnx file runs
+the network under ONNX Runtime's CPU provider.
+"""
+import argparse
+import inspect
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from dcunet import N_FFT, HOP_LENGTH
+from inference import DenoiseEngine, DEFAULT_WEIGHTS
+
+
+# 215 frames is a full 165000-sample block
+EXPORT_FRAMES = 1 + 165000 // HOP_LENGTH
+
+
+class MaskNet(nn.Module):
+    """
+    DCUnet20 without the iSTFT, for export.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x, is_istft=False)
+
+
+def export(weights_path, out_path, opset=13):
+    engine = DenoiseEngine(weights_path)
+    dummy = torch.zeros(1, 1, N_FFT // 2 + 1, EXPORT_FRAMES, 2)
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # the TorchScript-based exporter handles the dynamic frame axis
+        kwargs["dynamo"] = False
+    torch.onnx.export(MaskNet(engine.model).eval(), dummy, out_path,
+                      input_names=["noisy_stft"], output_names=["denoised_stft"],
+                      dynamic_axes={"noisy_stft": {0: "batch", 3: "frames"},
+                                    "denoised_stft": {0: "batch", 2: "frames"}},
+                      opset_version=opset, **kwargs)
+
+
+class OnnxModel():
+    """
+    Runs an exported mask network with ONNX Runtime; called like DCUnet20 with is_istft=False.
+    """
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, x, is_istft=False):
+        if is_istft:
+            raise ValueError("The ONNX model does not include the iSTFT")
+        x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        output, = self.session.run(None, {self.input_name: x})
+        return torch.from_numpy(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--opset", type=int, default=13)
+    args = parser.parse_args()
+
+    export(args.weights, args.out, args.opset)
+    print("Exported {} to {}".format(args.weights, args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Inference-time transforms for DCUnet20.
+
+`optimize_for_inference` folds the running statistics and affine parameters of
+every CBatchNorm2d into the complex convolution before it. Because the real
+and imaginary batch norms scale the two output parts differently, each folded
+layer becomes one real convolution over concatenated [real; imag] channels
+with the 2x2 block weight
+
+    [[s_r * W_r, -s_r * W_i],
+     [s_i * W_i,  s_i * W_r]]
+
+where s_r, s_i are the per-channel batch norm scales.
+
+Folding copies every weight, so a server folding at start-up cannot share the
+memory-mapped checkpoint pages between processes. `save_folded` writes the
+folded model as its own checkpoint, next to the original by default:
+
+    python optimize.py --weights Pretrained_Weights/Noise2Noise/mixed.pth            # mixed.folded.pth
+    python optimize.py --weights Pretrained_Weights/Noise2Noise/mixed.pth --native   # mixed.native.pth
+
+DenoiseEngine(optimize=True) (or native=True) then maps that file directly
+whenever it is at least as new as the original.
+"""
+import argparse
+import copy
+import os
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from dcunet import N_FFT, HOP_LENGTH, CConv2d, Encoder, Decoder, DCUnet20
+
+# file written next to a checkpoint for each folded layout
+FOLDED_SUFFIXES = {"optimize": ".folded.pth", "native": ".native.pth"}
+
+
+class FoldedComplexConv(nn.Module):
+    """
+    Complex (transposed) convolution with its batch norm folded in, computed as a
+    single real convolution over [real; imag] channels.
+    """
+    def __init__(self, conv):
+        super().__init__()
+        self.conv = conv
+
+    def forward(self, x):
+        x = torch.cat([x[..., 0], x[..., 1]], dim=1)
+        y = self.conv(x)
+        real, im = y.chunk(2, dim=1)
+        return torch.stack([real, im], dim=-1)
+
+
+def _bn_scale_shift(bn):
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        scale = scale * bn.weight
+        shift = shift * bn.weight + bn.bias
+    return scale, shift
+
+
+def fold_complex_conv(cconv, cbn=None):
+    """
+    Builds a FoldedComplexConv equivalent to `cbn(cconv(x))` (or `cconv(x)` without batch norm).
+    """
+    if isinstance(cconv, CConv2d):
+        real, im = cconv.real_conv, cconv.im_conv
+        transposed = False
+    else:
+        real, im = cconv.real_convt, cconv.im_convt
+        transposed = True
+
+    out_channels = cconv.out_channels
+    if cbn is not None:
+        scale_r, shift_r = _bn_scale_shift(cbn.real_b)
+        scale_i, shift_i = _bn_scale_shift(cbn.im_b)
+    else:
+        scale_r = scale_i = torch.ones(out_channels)
+        shift_r = shift_i = torch.zeros(out_channels)
+
+    w_r, w_i = real.weight.detach(), im.weight.detach()
+    b_r, b_i = real.bias.detach(), im.bias.detach()
+
+    if transposed:
+        # weights are (in, out, kh, kw): scale along dim 1, blocks indexed [in, out]
+        s_r = scale_r.view(1, -1, 1, 1)
+        s_i = scale_i.view(1, -1, 1, 1)
+        weight = torch.cat([torch.cat([s_r * w_r, s_i * w_i], dim=1),
+                            torch.cat([-s_r * w_i, s_i * w_r], dim=1)], dim=0)
+        folded = nn.ConvTranspose2d(2 * cconv.in_channels, 2 * out_channels, kernel_size=real.kernel_size,
+                                    stride=real.stride, padding=real.padding, output_padding=real.output_padding)
+    else:
+        # weights are (out, in, kh, kw): scale along dim 0, blocks indexed [out, in]
+        s_r = scale_r.view(-1, 1, 1, 1)
+        s_i = scale_i.view(-1, 1, 1, 1)
+        weight = torch.cat([torch.cat([s_r * w_r, -s_r * w_i], dim=1),
+                            torch.cat([s_i * w_i, s_i * w_r], dim=1)], dim=0)
+        folded = nn.Conv2d(2 * cconv.in_channels, 2 * out_channels, kernel_size=real.kernel_size,
+                           stride=real.stride, padding=real.padding)
+
+    # each part of the complex product carries one bias, see CConv2d.forward
+    bias = torch.cat([scale_r * (b_r - b_i) + shift_r, scale_i * (b_i + b_r) + shift_i])
+
+    with torch.no_grad():
+        folded.weight.copy_(weight)
+        folded.bias.copy_(bias)
+    return FoldedComplexConv(folded).to(w_r.device)
+
+
+def verify_equivalence(reference, optimized, frames=103, atol=1e-4):
+    """
+    Compares both models on a random spectrogram and raises if they differ by more than `atol`.
+    Returns the maximum absolute difference.
+    """
+    param = next(reference.parameters())
+    x = torch.randn(1, 1, reference.n_fft // 2 + 1, frames, 2, device=param.device)
+    with torch.no_grad():
+        expected = reference(x, is_istft=False)
+        actual = optimized(x, is_istft=False)
+    diff = (expected - actual).abs().max().item()
+    if diff > atol:
+        raise RuntimeError("Optimized model differs from the original by {:.3g}".format(diff))
+    return diff
+
+
+def optimize_for_inference(model, verify=True):
+    """
+    Returns a copy of an eval-mode DCUnet20 with every batch norm folded into its
+    convolution and removed.
+    """
+    if model.training:
+        raise ValueError("Batch norm can only be folded in eval mode")
+
+    optimized = copy.deepcopy(model)
+    for module in optimized.modules():
+        if isinstance(module, Encoder):
+            module.cconv = fold_complex_conv(module.cconv, module.cbn)
+            module.cbn = nn.Identity()
+        elif isinstance(module, Decoder):
+            # the last decoder layer has no batch norm, only the mask
+            module.cconvt = fold_complex_conv(module.cconvt, None if module.last_layer else module.cbn)
+            module.cbn = nn.Identity()
+    optimized.eval()
+
+    if verify:
+        verify_equivalence(model, optimized)
+    return optimized
+
+
+def folded_path(weights_path, layout):
+    """
+    Where `save_folded` puts the `layout` ("optimize" or "native") version of a checkpoint by default.
+    """
+    path = Path(weights_path)
+    return str(path.with_name(path.stem + FOLDED_SUFFIXES[layout]))
+
+
+def is_folded_path(path):
+    return any(str(path).endswith(suffix) for suffix in FOLDED_SUFFIXES.values())
+
+
+def find_folded(weights_path, layout):
+    """
+    The folded checkpoint saved for `weights_path`, or None if there is none at
+    least as new as the original.
+    """
+    path = folded_path(weights_path, layout)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights_path):
+        return path
+    return None
+
+
+def save_folded(model, path, layout):
+    torch.save({"folded": layout, "state_dict": model.state_dict()}, path)
+
+
+def load_folded(checkpoint):
+    """
+    Rebuilds the model of a checkpoint written by `save_folded`. The tensors of
+    the checkpoint are used as they are, so a memory-mapped file stays shared.
+    """
+    from inference import _load_state_dict
+
+    # only the module structure of this conversion is kept, its weights are replaced
+    model = DCUnet20(N_FFT, HOP_LENGTH).eval()
+    if checkpoint["folded"] == "native":
+        from dcunet_native import DCUnet20Native
+        model = DCUnet20Native.from_dcunet20(model)
+    else:
+        model = optimize_for_inference(model, verify=False)
+    _load_state_dict(model, checkpoint["state_dict"])
+    return model.eval()
+
+
+def main():
+    from inference import DEFAULT_WEIGHTS, load_checkpoint, _load_state_dict
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--native", action="store_true", help="channel-split layout of dcunet_native.py")
+    parser.add_argument("--out", help="defaults to the checkpoint name with .folded.pth or .native.pth")
+    args = parser.parse_args()
+
+    layout = "native" if args.native else "optimize"
+    model = DCUnet20(N_FFT, HOP_LENGTH)
+    _load_state_dict(model, load_checkpoint(args.weights))
+    model.eval()
+    if args.native:
+        from dcunet_native import DCUnet20Native
+        folded = DCUnet20Native.from_dcunet20(model)
+    else:
+        folded = optimize_for_inference(model)
+
+    out = args.out or folded_path(args.weights, layout)
+    save_folded(folded, out, layout)
+    print("Saved the {} model of {} to {}".format(layout, args.weights, out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Reduced-precision CPU inference for DCUnet20.
+
+With `DenoiseEngine(..., precision="bfloat16")` the convolutions run under CPU
+autocast in bfloat16 (float16 where the torch build supports it), while the
+STFT, the mask (phase normalisation and tanh magnitude of the last Decoder)
+and the iSTFT stay in float32. CPUs with native BF16 instructions (AVX-512
+BF16, AMX) run the convolutions much faster; elsewhere bfloat16 is emulated
+and usually slower, so the mode is opt-in.
+
+When an engine is built in reduced precision it denoises a fixed synthetic
+signal in both precisions and falls back to float32 if the outputs differ by
+more than the guard allows. The PESQ/STOI cost on real files is checked with
+
+    python precision.py --noisy-dir Datasets/WhiteNoise_Test_Input --clean-dir Datasets/clean_testset_wav \
+        --max-pesq-drop 0.05 --max-stoi-drop 0.005
+"""
+import argparse
+import contextlib
+import json
+import math
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from dcunet import SAMPLE_RATE
+
+PRECISIONS = {"float32": torch.float32, "bfloat16": torch.bfloat16, "float16": torch.float16}
+
+# Minimum signal-to-error ratio (dB) of reduced-precision output against float32
+DEFAULT_MIN_SNR_DB = 30.0
+
+
+def autocast(device, precision):
+    """
+    Context manager running the model in `precision` on `device`.
+    """
+    if precision == "float32":
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=PRECISIONS[precision])
+
+
+def check_supported(device, precision):
+    """
+    Raises ValueError if this torch build cannot autocast to `precision` on `device`.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("precision must be one of {}, got {!r}".format(", ".join(PRECISIONS), precision))
+    if precision == "float32":
+        return
+    # torch.autocast (with CPU support) only exists from torch 1.10 onwards
+    if not hasattr(torch, "autocast"):
+        raise ValueError("{} inference needs torch >= 1.10, found {}".format(precision, torch.__version__))
+    try:
+        with autocast(device, precision):
+            torch.nn.functional.conv2d(torch.ones(1, 1, 3, 3, device=device), torch.ones(1, 1, 2, 2, device=device))
+    except RuntimeError as e:
+        raise ValueError("{} autocast is not supported on {}: {}".format(precision, device, e))
+
+
+def signal_to_error_db(reference, estimate):
+    """
+    Ratio of reference energy to the energy of estimate - reference, in dB.
+    """
+    error = (estimate.double() - reference.double()).pow(2).sum().item()
+    energy = reference.double().pow(2).sum().item()
+    if error == 0:
+        return math.inf
+    return 10 * math.log10(energy / error) if energy > 0 else -math.inf
+
+
+def guard_signal(length, sample_rate, seed=0):
+    """
+    Fixed test signal for the accuracy guard: a harmonic tone with vibrato in noise.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    t = torch.arange(length, dtype=torch.float64) / sample_rate
+    phase = 2 * math.pi * (220 * t + 3 * torch.sin(2 * math.pi * 5 * t))
+    voiced = sum(torch.sin(k * phase) / k for k in range(1, 6))
+    noise = torch.randn(length, generator=generator, dtype=torch.float64)
+    return (0.3 * voiced + 0.05 * noise).float().unsqueeze(0)
+
+
+def accuracy_guard(engine, min_snr_db=DEFAULT_MIN_SNR_DB):
+    """
+    Denoises the guard signal in the engine's precision and in float32 and returns
+    the signal-to-error ratio in dB. Sets the engine back to float32 (with a
+    warning) when it is below `min_snr_db`.
+    """
+    chunks = guard_signal(engine.valid_length(engine.max_len // 2), SAMPLE_RATE).to(engine.device)
+    precision = engine.precision
+    with torch.no_grad():
+        reduced = engine.denoise_chunks(chunks)
+        engine.precision = "float32"
+        reference = engine.denoise_chunks(chunks)
+    snr_db = signal_to_error_db(reference, reduced)
+
+    if snr_db >= min_snr_db:
+        engine.precision = precision
+    else:
+        warnings.warn("{} output is only {:.1f} dB from float32 (guard {:.1f} dB), using float32".format(
+            precision, snr_db, min_snr_db))
+    return snr_db
+
+
+def compare(weights_path, precision, noisy_files, clean_files, **engine_kwargs):
+    """
+    PESQ/STOI/SSNR of float32 and reduced-precision engines on the same files,
+    with the mean signal-to-error ratio between their outputs.
+    """
+    from inference import DenoiseEngine
+    from metrics import AudioMetrics
+    from resampling import resample
+    import torchaudio
+
+    reference = DenoiseEngine(weights_path, **engine_kwargs)
+    reduced = DenoiseEngine(weights_path, precision=precision, **engine_kwargs)
+    if reduced.precision != precision:
+        raise RuntimeError("{} failed the accuracy guard ({:.1f} dB)".format(precision, reduced.precision_snr_db))
+
+    scores = {name: {"PESQ": [], "STOI": [], "SSNR": []} for name in ("float32", precision)}
+    snrs = []
+    for noisy_file, clean_file in zip(sorted(noisy_files), sorted(clean_files)):
+        noisy, sr = torchaudio.load(str(noisy_file))
+        clean, clean_sr = torchaudio.load(str(clean_file))
+        clean = resample(clean[0].numpy(), clean_sr, SAMPLE_RATE)
+
+        outputs = {"float32": reference.denoise(noisy, sr), precision: reduced.denoise(noisy, sr)}
+        snrs.append(signal_to_error_db(outputs["float32"], outputs[precision]))
+        for name, denoised in outputs.items():
+            n = min(len(clean), denoised.size(1))
+            metrics = AudioMetrics(clean[:n], denoised[0, :n].numpy(), SAMPLE_RATE)
+            for metric in scores[name]:
+                scores[name][metric].append(getattr(metrics, metric))
+
+    report = {name: {metric: float(np.mean(values)) if values else None for metric, values in result.items()}
+              for name, result in scores.items()}
+    report["snr_db"] = float(np.mean(snrs)) if snrs else None
+    report["delta"] = {metric: report[precision][metric] - report["float32"][metric]
+                       for metric in ("PESQ", "STOI", "SSNR") if report["float32"][metric] is not None}
+    return report
+
+
+def main():
+    from inference import DEFAULT_WEIGHTS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--precision", default="bfloat16", choices=[p for p in PRECISIONS if p != "float32"])
+    parser.add_argument("--noisy-dir", required=True)
+    parser.add_argument("--clean-dir", required=True)
+    parser.add_argument("--max-pesq-drop", type=float, default=0.05)
+    parser.add_argument("--max-stoi-drop", type=float, default=0.005)
+    parser.add_argument("--report", help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = compare(args.weights, args.precision,
+                     Path(args.noisy_dir).rglob("*.wav"), Path(args.clean_dir).rglob("*.wav"))
+
+    fstring = "{:<8}{:>12}{:>12}{:>12}"
+    print(fstring.format("", "float32", args.precision, "delta"))
+    for metric in ("PESQ", "STOI", "SSNR"):
+        print(fstring.format(metric, *("{:.3f}".format(value) if value is not None else "-" for value in
+                                       (report["float32"][metric], report[args.precision][metric],
+                                        report["delta"].get(metric)))))
+    print("output is {:.1f} dB from float32".format(report["snr_db"]))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = (report["delta"].get("PESQ", 0) < -args.max_pesq_drop or
+              report["delta"].get("STOI", 0) < -args.max_stoi_drop)
+    if failed:
+        print("{} loses more than {} PESQ / {} STOI".format(args.precision, args.max_pesq_drop, args.max_stoi_drop))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Per-layer CPU profile of DCUnet20.
+
+Forward hooks on every CConv2d, CConvTranspose2d, CBatchNorm2d and LeakyReLU
+record the wall time, an estimate of the floating point operations, the
+output shape and the bytes of the output activation of each layer while the
+model denoises synthetic audio. Layers are reported individually or summed
+per Encoder/Decoder block; time spent outside the hooked layers (skip
+concatenations, the mask of the last Decoder) is reported as "other".
+
+    python profile_layers.py --duration 3.4 --sort time
+    python profile_layers.py --weights Pretrained_Weights/Noise2Noise/white.pth --by-block --json layers.json
+"""
+import argparse
+import json
+import time
+
+import torch
+import torch.nn as nn
+
+from dcunet import SAMPLE_RATE, N_FFT, HOP_LENGTH, CConv2d, CConvTranspose2d, CBatchNorm2d, DCUnet20
+from inference import _inference_mode
+from precision import guard_signal
+
+PROFILED = (CConv2d, CConvTranspose2d, CBatchNorm2d, nn.LeakyReLU)
+
+SORT_KEYS = {"order": "index", "time": "seconds", "flops": "flops", "bytes": "activation_bytes"}
+
+
+def estimate_flops(module, x, output):
+    """
+    Floating point operations (a multiply-add counts as two) of one call of
+    `module` on the stacked real/imag input `x` giving `output`.
+    """
+    if isinstance(module, CConv2d):
+        # four real convolutions, then one add and one subtract per output element
+        conv = module.real_conv
+        per_output = 2 * conv.in_channels // conv.groups * conv.kernel_size[0] * conv.kernel_size[1]
+        return 4 * per_output * output.numel() // 2 + output.numel()
+    if isinstance(module, CConvTranspose2d):
+        # every input element is scattered through a full kernel per output channel
+        conv = module.real_convt
+        per_input = 2 * conv.out_channels // conv.groups * conv.kernel_size[0] * conv.kernel_size[1]
+        return 4 * per_input * x.numel() // 2 + output.numel()
+    if isinstance(module, CBatchNorm2d):
+        # scale and shift in eval mode
+        return 2 * output.numel()
+    return output.numel()
+
+
+class LayerProfiler():
+    """
+    Attaches timing hooks to the profiled layers of `model`; results accumulate
+    over every forward pass until `reset`.
+    """
+    def __init__(self, model):
+        self.layers = []
+        self._handles = []
+        for name, module in model.named_modules():
+            if isinstance(module, PROFILED):
+                self._add(name, module)
+        self.reset()
+
+    def _add(self, name, module):
+        index = len(self.layers)
+        self.layers.append({"index": index, "name": name, "block": name.split(".")[0],
+                            "type": type(module).__name__})
+
+        def pre_hook(module, inputs):
+            self._start[index] = time.perf_counter()
+
+        def hook(module, inputs, output):
+            elapsed = time.perf_counter() - self._start.pop(index)
+            record = self.records[index]
+            record["seconds"] += elapsed
+            record["calls"] += 1
+            record["flops"] = estimate_flops(module, inputs[0], output)
+            record["output_shape"] = list(output.shape)
+            record["activation_bytes"] = output.numel() * output.element_size()
+
+        self._handles.append(module.register_forward_pre_hook(pre_hook))
+        self._handles.append(module.register_forward_hook(hook))
+
+    def reset(self):
+        self._start = {}
+        self.records = [{"seconds": 0.0, "calls": 0, "flops": 0, "output_shape": None, "activation_bytes": 0}
+                        for _ in self.layers]
+
+    def remove(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def results(self):
+        """
+        One dict per layer that ran, with the mean seconds per forward pass.
+        """
+        rows = []
+        for layer, record in zip(self.layers, self.records):
+            # the last Decoder skips its batch norm and activation
+            if not record["calls"]:
+                continue
+            calls = record["calls"]
+            rows.append(dict(layer, seconds=record["seconds"] / calls, flops=record["flops"],
+                             output_shape=record["output_shape"], activation_bytes=record["activation_bytes"]))
+        return rows
+
+
+def by_block(rows):
+    """
+    Sums layer rows per Encoder/Decoder block, in model order.
+    """
+    blocks = {}
+    for row in rows:
+        block = blocks.setdefault(row["block"], {"index": len(blocks), "name": row["block"], "block": row["block"],
+                                                 "type": "block", "seconds": 0.0, "flops": 0,
+                                                 "output_shape": None, "activation_bytes": 0})
+        block["seconds"] += row["seconds"]
+        block["flops"] += row["flops"]
+        block["activation_bytes"] += row["activation_bytes"]
+        # the block output is the output of its last layer
+        block["output_shape"] = row["output_shape"]
+    return list(blocks.values())
+
+
+def synthetic_input(model, duration, batch_size=1, seed=0):
+    """
+    (batch, samples) test signals (see precision.guard_signal), at least `duration`
+    seconds long and padded to the next length `model` accepts.
+    """
+    frames = 1 + int(duration * SAMPLE_RATE) // HOP_LENGTH
+    while not model.fits_frames(frames):
+        frames += 1
+    length = (frames - 1) * HOP_LENGTH
+    return torch.cat([guard_signal(length, SAMPLE_RATE, seed + i) for i in range(batch_size)])
+
+
+def profile(model, waveform, repeats=3, warmup=1):
+    """
+    Profiles `repeats` forward passes of `model` on the spectrogram of a
+    (batch, samples) waveform. Returns (layer rows, mean forward seconds).
+    """
+    spec = torch.stft(waveform, n_fft=N_FFT, hop_length=HOP_LENGTH, normalized=True, return_complex=True)
+    x = torch.view_as_real(spec).unsqueeze(1)
+
+    profiler = LayerProfiler(model)
+    try:
+        with _inference_mode():
+            for _ in range(warmup):
+                model(x, is_istft=False)
+            profiler.reset()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model(x, is_istft=False)
+            total = (time.perf_counter() - start) / repeats
+        return profiler.results(), total
+    finally:
+        profiler.remove()
+
+
+def report(rows, total, sort="order"):
+    """
+    Table of `rows` sorted by `sort` (see SORT_KEYS), with an "other" line for
+    time spent outside them.
+    """
+    key = SORT_KEYS[sort]
+    rows = sorted(rows, key=lambda row: row[key], reverse=sort != "order")
+    fstring = "{:<22}{:<18}{:>11}{:>8}{:>12}{:>12}  {}"
+    lines = [fstring.format("layer", "type", "ms", "%", "MFLOP", "MiB", "output shape")]
+    for row in rows:
+        lines.append(fstring.format(row["name"], row["type"], "{:.2f}".format(row["seconds"] * 1000),
+                                    "{:.1f}".format(100 * row["seconds"] / total),
+                                    "{:.1f}".format(row["flops"] / 1e6),
+                                    "{:.2f}".format(row["activation_bytes"] / 2 ** 20),
+                                    "x".join(str(size) for size in row["output_shape"] or [])))
+    other = total - sum(row["seconds"] for row in rows)
+    lines.append(fstring.format("other", "", "{:.2f}".format(other * 1000), "{:.1f}".format(100 * other / total),
+                                "", "", ""))
+    lines.append(fstring.format("total", "", "{:.2f}".format(total * 1000), "100.0",
+                                "{:.1f}".format(sum(row["flops"] for row in rows) / 1e6), "", ""))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", help="checkpoint to load, random weights when omitted (timing is the same)")
+    parser.add_argument("--duration", type=float, default=3.4, help="seconds of synthetic audio per block")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads")
+    parser.add_argument("--sort", default="order", choices=sorted(SORT_KEYS))
+    parser.add_argument("--by-block", action="store_true", help="sum the layers of each Encoder/Decoder")
+    parser.add_argument("--json", help="write the rows as JSON")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model = DCUnet20(N_FFT, HOP_LENGTH)
+    if args.weights:
+        from inference import load_checkpoint, _load_state_dict
+        _load_state_dict(model, load_checkpoint(args.weights))
+    model.eval()
+
+    waveform = synthetic_input(model, args.duration, args.batch_size)
+    rows, total = profile(model, waveform, args.repeats)
+    if args.by_block:
+        rows = by_block(rows)
+
+    print("{} x {} samples, {} threads".format(*waveform.shape, torch.get_num_threads()))
+    print(report(rows, total, args.sort))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"samples": waveform.size(1), "batch_size": waveform.size(0), "threads": torch.get_num_threads(),
+                       "forward_seconds": total, "layers": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Post-training static INT8 quantization of DCUnet20 for CPU inference.
+
+Every real-valued nn.Conv2d / nn.ConvTranspose2d inside the complex layers is
+wrapped in quant/dequant stubs and quantized; batch norm, the mask and the
+STFT/iSTFT stay in float32. PyTorch's dynamic quantization only covers
+Linear/RNN layers, so convolutions need a calibration pass over sample files.
+
+    python quantization.py quantize --calib-dir Samples/Sample_Test_Input --out Pretrained_Weights/Noise2Noise/mixed_int8.pth
+    python quantization.py compare --quantized Pretrained_Weights/Noise2Noise/mixed_int8.pth \
+        --noisy-dir Datasets/WhiteNoise_Test_Input --clean-dir Datasets/clean_testset_wav
+
+The quantized artifact can be passed to DenoiseEngine (or DENOISE_WEIGHTS) like
+an ordinary checkpoint.
+"""
+import argparse
+import io
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch import quantization as tq
+
+from dcunet import N_FFT, HOP_LENGTH, CConv2d, CConvTranspose2d, DCUnet20
+from inference import DenoiseEngine, DEFAULT_WEIGHTS
+
+
+def _qconfig(backend, transposed):
+    if transposed:
+        # per-channel weight observers are not supported for transposed convolutions
+        return tq.QConfig(activation=tq.HistogramObserver.with_args(reduce_range=True),
+                          weight=tq.default_weight_observer)
+    return tq.get_default_qconfig(backend)
+
+
+def prepare_quantizable(model, backend="fbgemm"):
+    """
+    Wraps the convolutions of a float DCUnet20 in quant/dequant stubs and inserts observers.
+    """
+    torch.backends.quantized.engine = backend
+    model.eval()
+    for module in list(model.modules()):
+        if isinstance(module, (CConv2d, CConvTranspose2d)):
+            # the fused path calls the float weights directly, and the wrapped
+            # convolutions no longer read from the packed ones
+            module.fused = False
+            module._packed = None
+        for name, child in list(module.named_children()):
+            if isinstance(child, (nn.Conv2d, nn.ConvTranspose2d)):
+                wrapper = tq.QuantWrapper(child)
+                wrapper.qconfig = _qconfig(backend, isinstance(child, nn.ConvTranspose2d))
+                setattr(module, name, wrapper)
+    tq.prepare(model, inplace=True)
+    return model
+
+
+def calibrate(model, files, engine):
+    """
+    Runs the observed model over sample files through the engine's pipeline.
+    """
+    import torchaudio
+
+    float_model = engine.model
+    engine.model = model
+    try:
+        for file in files:
+            waveform, sr = torchaudio.load(str(file))
+            engine.denoise(waveform, sr)
+    finally:
+        engine.model = float_model
+    return model
+
+
+def quantize(weights_path, calibration_files, backend="fbgemm"):
+    """
+    Returns an INT8 DCUnet20 calibrated on `calibration_files`.
+    """
+    engine = DenoiseEngine(weights_path)
+    model = DCUnet20(N_FFT, HOP_LENGTH)
+    model.load_state_dict(engine.model.state_dict())
+    prepare_quantizable(model, backend)
+    calibrate(model, calibration_files, engine)
+    tq.convert(model, inplace=True)
+    return model
+
+
+def save_quantized(model, path, backend="fbgemm"):
+    torch.save({"quantized": True, "backend": backend, "state_dict": model.state_dict()}, path)
+
+
+def load_quantized(checkpoint):
+    """
+    Rebuilds the quantized DCUnet20 from a checkpoint written by `save_quantized`.
+    """
+    backend = checkpoint["backend"]
+    model = prepare_quantizable(DCUnet20(N_FFT, HOP_LENGTH), backend)
+    tq.convert(model, inplace=True)
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    return model
+
+
+def _model_bytes(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def _evaluate(engine, pairs):
+    from metrics import AudioMetrics
+    from resampling import resample
+    import torchaudio
+
+    seconds, audio_seconds = 0.0, 0.0
+    scores = {"PESQ": [], "STOI": [], "SSNR": []}
+    for noisy_file, clean_file in pairs:
+        noisy, sr = torchaudio.load(str(noisy_file))
+        clean, clean_sr = torchaudio.load(str(clean_file))
+
+        start = time.perf_counter()
+        denoised = engine.denoise(noisy, sr)
+        seconds += time.perf_counter() - start
+        audio_seconds += noisy.size(1) / sr
+
+        if clean_sr != 48000:
+            clean = torch.from_numpy(resample(clean.numpy(), clean_sr, 48000, axis=-1))
+        n = min(clean.size(1), denoised.size(1))
+        metrics = AudioMetrics(clean[0, :n].numpy(), denoised[0, :n].numpy(), 48000)
+        for name in scores:
+            scores[name].append(getattr(metrics, name))
+
+    report = {"seconds": seconds, "rtf": seconds / audio_seconds if audio_seconds else None,
+              "model_bytes": _model_bytes(engine.model)}
+    for name, values in scores.items():
+        report[name] = float(np.mean(values)) if values else None
+    return report
+
+
+def compare(weights_path, quantized_path, noisy_files, clean_files):
+    """
+    Latency, model size and PESQ/STOI/SSNR of the float and INT8 models on the same files.
+    """
+    pairs = list(zip(sorted(noisy_files), sorted(clean_files)))
+    report = {"float": _evaluate(DenoiseEngine(weights_path), pairs),
+              "int8": _evaluate(DenoiseEngine(quantized_path), pairs)}
+    report["delta"] = {key: report["int8"][key] - report["float"][key]
+                       for key in ("seconds", "PESQ", "STOI", "SSNR")
+                       if report["int8"][key] is not None and report["float"][key] is not None}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--backend", default="fbgemm", help="fbgemm (x86) or qnnpack (ARM)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    quantize_parser = commands.add_parser("quantize")
+    quantize_parser.add_argument("--calib-dir", required=True)
+    quantize_parser.add_argument("--out", required=True)
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("--quantized", required=True)
+    compare_parser.add_argument("--noisy-dir", required=True)
+    compare_parser.add_argument("--clean-dir", required=True)
+    compare_parser.add_argument("--report", help="write the report as JSON")
+
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        files = sorted(Path(args.calib_dir).rglob("*.wav"))
+        model = quantize(args.weights, files, args.backend)
+        save_quantized(model, args.out, args.backend)
+        print("Saved quantized model calibrated on {} files to {}".format(len(files), args.out))
+    else:
+        report = compare(args.weights, args.quantized,
+                         Path(args.noisy_dir).rglob("*.wav"), Path(args.clean_dir).rglob("*.wav"))
+        fstring = "{:<12}{:>14}{:>14}"
+        print(fstring.format("", "float32", "int8"))
+        for key in ("seconds", "rtf", "model_bytes", "PESQ", "STOI", "SSNR"):
+            print(fstring.format(key, *("{:.3f}".format(report[m][key]) if report[m][key] is not None else "-"
+                                       for m in ("float", "int8"))))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Local test client for the /ws/denoise endpoint in realtime_server.py.
+
+Streams a WAV file in small frames (optionally paced in real time), writes the
+denoised audio and prints the per-frame processing times and real-time factor.
+
+    python realtime_client.py Samples/noisy.wav Samples/denoised_live.wav --realtime
+"""
+import argparse
+import asyncio
+import json
+
+import numpy as np
+import torch
+import torchaudio
+import websockets
+
+from dcunet import SAMPLE_RATE
+from resampling import resample
+
+
+async def run(args):
+    waveform, sr = torchaudio.load(args.input)
+    pcm = resample(waveform[0].numpy(), sr, SAMPLE_RATE).astype("<f4")
+    frame_len = int(SAMPLE_RATE * args.frame_ms / 1000)
+
+    outputs = []
+    stats = []
+    async with websockets.connect(args.url, max_size=None) as ws:
+        config = json.loads(await ws.recv())
+        if "error" in config:
+            raise RuntimeError(config["error"])
+        print("Connected: window {window} hop {hop} (latency {latency_ms:.0f} ms)".format(**config))
+
+        async def sender():
+            for start in range(0, len(pcm), frame_len):
+                await ws.send(pcm[start:start + frame_len].tobytes())
+                if args.realtime:
+                    await asyncio.sleep(frame_len / SAMPLE_RATE)
+            await ws.send("flush")
+
+        async def receiver():
+            async for message in ws:
+                if isinstance(message, bytes):
+                    outputs.append(np.frombuffer(message, dtype="<f4"))
+                    continue
+                data = json.loads(message)
+                if data.get("event") == "end":
+                    break
+                stats.append(data)
+
+        await asyncio.gather(sender(), receiver())
+
+    denoised = np.concatenate(outputs) if outputs else np.zeros(0, dtype="<f4")
+    torchaudio.save(args.output, torch.from_numpy(denoised.copy()).unsqueeze(0), SAMPLE_RATE, bits_per_sample=16)
+
+    processing = np.array([s["processing_ms"] for s in stats])
+    audio_seconds = len(pcm) / SAMPLE_RATE
+    print("Frames sent:\t\t{}".format(len(stats)))
+    print("Processing ms:\t\tmean {:.2f}  p95 {:.2f}  max {:.2f}".format(
+        processing.mean(), np.percentile(processing, 95), processing.max()))
+    print("Real-time factor:\t{:.3f}".format(processing.sum() / 1000 / audio_seconds))
+    print("Samples in/out:\t\t{}/{}".format(len(pcm), len(denoised)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--url", default="ws://localhost:5000/ws/denoise")
+    parser.add_argument("--frame-ms", type=float, default=20)
+    parser.add_argument("--realtime", action="store_true", help="pace frames like a live microphone")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Real-time denoising over a WebSocket, served alongside the Flask app.
+
+    uvicorn realtime_server:app --host 0.0.0.0 --port 5000
+
+The Flask routes from server.py are mounted on the same app, so /denoise and
+/ws/denoise share one resident model. Clients send binary messages of mono
+little-endian float32 PCM at SAMPLE_RATE and receive denoised PCM in the same
+format, each output followed by a JSON message with the frame's timings. A
+text message "flush" drains the remaining audio and ends the stream.
+"""
+import time
+
+import numpy as np
+from fastapi import FastAPI, WebSocket
+from fastapi.middleware.wsgi import WSGIMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from dcunet import SAMPLE_RATE
+from server import app as flask_app, engine
+from streaming import StreamDenoiser
+
+
+# 103 STFT frames, the shortest input DCUnet20 accepts (~1.6 s at 48 kHz).
+# The window bounds the algorithmic latency, the hop sets how often we run the model
+# (half the window unless the client asks otherwise).
+REALTIME_WINDOW = 78336
+
+app = FastAPI()
+
+
+@app.websocket("/ws/denoise")
+async def denoise_stream(websocket: WebSocket, window: int = REALTIME_WINDOW, hop: int = None):
+    await websocket.accept()
+
+    if hop is None:
+        hop = window // 2
+    try:
+        denoiser = StreamDenoiser(engine, window, hop)
+    except ValueError as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    await websocket.send_json({"sample_rate": SAMPLE_RATE, "window": window, "hop": hop,
+                               "latency_ms": 1000 * window / SAMPLE_RATE})
+
+    frame = 0
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            break
+
+        if message.get("bytes") is not None:
+            block = np.frombuffer(message["bytes"], dtype="<f4").copy()
+            start = time.perf_counter()
+            output = await run_in_threadpool(denoiser.push, block)
+        elif message.get("text") == "flush":
+            block = np.zeros(0, dtype="<f4")
+            start = time.perf_counter()
+            output = await run_in_threadpool(denoiser.flush)
+        else:
+            continue
+        elapsed = time.perf_counter() - start
+
+        if output.numel():
+            await websocket.send_bytes(output.numpy().astype("<f4").tobytes())
+
+        duration = len(block) / SAMPLE_RATE
+        await websocket.send_json({"frame": frame,
+                                   "samples_in": len(block),
+                                   "samples_out": output.numel(),
+                                   "processing_ms": 1000 * elapsed,
+                                   "rtf": elapsed / duration if duration else None})
+        frame += 1
+
+        if message.get("text") == "flush":
+            await websocket.send_json({"event": "end"})
+            await websocket.close()
+            break
+
+
+# Everything else is handled by the Flask app
+app.mount("/", WSGIMiddleware(flask_app))
@@ -0,0 +1,236 @@
+"""
+Registry of DCUnet20 variants served side by side.
+
+Weights are discovered under Pretrained_Weights/ and in the
+`{noise_class}_{training_type}/Weights` folders written by training, e.g.
+
+    Noise2Noise/mixed          Pretrained_Weights/Noise2Noise/mixed.pth
+    Noise2Noise/mixed.onnx     Pretrained_Weights/Noise2Noise/mixed.onnx
+    white_Noise2Noise/dc20     white_Noise2Noise/Weights/dc20.pth
+
+Only .pth checkpoints are named without their suffix, so exported ONNX and
+safetensors files sit next to them under their own names.
+
+A DenoiseEngine is only built the first time a model is asked for. Checkpoints
+are memory-mapped (see inference.load_checkpoint), so workers loading the same
+file share its pages, and the least recently used engines are closed and
+dropped once the loaded models exceed the memory budget. Folded checkpoints
+saved by optimize.py are not listed separately: the engine of their original
+picks them up. A file registered under a second name is served by the same
+engine. Options of the float model (folding, native layout, precision) are
+only passed to engines of float checkpoints, and onnx_threads only to ONNX ones.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+import torch
+
+import telemetry
+from inference import DenoiseEngine, load_checkpoint
+from optimize import is_folded_path
+
+WEIGHT_SUFFIXES = (".pth", ".safetensors", ".onnx")
+
+# DenoiseEngine options that only apply to one backend, see checkpoint_backend
+BACKEND_OPTIONS = {"float": ("optimize", "native", "precision"), "onnx": ("onnx_threads",)}
+
+
+def _model_name(path):
+    # .pth checkpoints keep the short name, other artifacts of the same model their suffix
+    return path.stem if path.suffix == ".pth" else path.name
+
+
+def discover(root="."):
+    """
+    Returns {name: path} for every checkpoint under `root`.
+    """
+    root = Path(root)
+    found = {}
+    pretrained = root / "Pretrained_Weights"
+    for path in sorted(pretrained.rglob("*")):
+        if path.suffix in WEIGHT_SUFFIXES and not is_folded_path(path):
+            found[(path.parent.relative_to(pretrained) / _model_name(path)).as_posix()] = str(path)
+
+    for weights_dir in sorted(root.glob("*_*/Weights")):
+        for path in sorted(weights_dir.iterdir()):
+            if path.suffix in WEIGHT_SUFFIXES and not is_folded_path(path):
+                found[weights_dir.parent.name + "/" + _model_name(path)] = str(path)
+    return found
+
+
+def checkpoint_backend(path):
+    """
+    "onnx" for exported ONNX models, "int8" for checkpoints written by
+    quantization.py and "float" for ordinary ones.
+    """
+    if str(path).endswith(".onnx"):
+        return "onnx"
+    if str(path).endswith(".pth"):
+        # mapped where possible, so this only reads the header of large checkpoints
+        checkpoint = load_checkpoint(path)
+        if isinstance(checkpoint, dict) and checkpoint.get("quantized") is True:
+            return "int8"
+    return "float"
+
+
+def backend_kwargs(path, engine_kwargs):
+    """
+    `engine_kwargs` without the options of other backends than the one of `path`.
+    """
+    backend = checkpoint_backend(path)
+    excluded = {option for other, options in BACKEND_OPTIONS.items() if other != backend for option in options}
+    return {key: value for key, value in engine_kwargs.items() if key not in excluded}
+
+
+def engine_bytes(engine):
+    """
+    Memory held by an engine's model: its state dict (which also covers packed
+    INT8 weights), or the file size for ONNX models.
+    """
+    if not hasattr(engine.model, "state_dict"):
+        return os.path.getsize(engine.weights_path)
+    return sum(t.numel() * t.element_size() for t in engine.model.state_dict().values()
+               if isinstance(t, torch.Tensor))
+
+
+class ModelRegistry():
+    """
+    Lazily built DenoiseEngines keyed by model name, LRU-evicted under `max_bytes`
+    (None for no limit). Pinned models are never evicted. `engine_kwargs` are
+    passed to every DenoiseEngine whose backend takes them (see backend_kwargs),
+    and with `max_wait_ms` each engine starts micro-batching when it is built.
+    """
+    def __init__(self, models=None, max_bytes=None, max_wait_ms=None, **engine_kwargs):
+        self.paths = {}
+        # extra name -> registered name with the same file
+        self._aliases = {}
+        self.max_bytes = max_bytes
+        self.max_wait_ms = max_wait_ms
+        self.engine_kwargs = engine_kwargs
+
+        self._engines = OrderedDict()
+        self._sizes = {}
+        self._pinned = set()
+        # name -> Future of an engine being built, shared by concurrent callers
+        self._loading = {}
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.evictions = 0
+
+        for name, path in (models or {}).items():
+            self.register(name, path)
+
+    def register(self, name, path, pin=False):
+        """
+        Adds a model. A file that is already registered becomes an alias of its
+        first name, so it is only ever loaded once.
+        """
+        with self._lock:
+            resolved = os.path.realpath(path)
+            existing = next((other for other, other_path in self.paths.items()
+                             if os.path.realpath(other_path) == resolved and other != name), None)
+            if existing is not None:
+                self._aliases[name] = existing
+                self.paths.pop(name, None)
+                name = existing
+            else:
+                self._aliases.pop(name, None)
+                self.paths[name] = str(path)
+            if pin:
+                self._pinned.add(name)
+
+    def names(self):
+        return sorted(list(self.paths) + list(self._aliases))
+
+    def loaded(self):
+        """
+        {name: engine} of the models currently in memory, least recently used first.
+        """
+        with self._lock:
+            return OrderedDict(self._engines)
+
+    def get(self, name):
+        """
+        Returns the engine for `name`, building it on first use. Raises KeyError for unknown models.
+        """
+        with self._lock:
+            name = self._aliases.get(name, name)
+            if name not in self.paths:
+                raise KeyError(name)
+
+            engine = self._engines.get(name)
+            if engine is not None:
+                self._engines.move_to_end(name)
+                return engine
+
+            # the first caller builds the engine, later ones wait for its result
+            loading = self._loading.get(name)
+            if loading is None:
+                future = self._loading[name] = Future()
+                path = self.paths[name]
+        if loading is not None:
+            return loading.result()
+
+        # built outside the lock, so requests for loaded models never wait on a cold load
+        try:
+            with telemetry.span("model_load"):
+                engine = DenoiseEngine(path, **backend_kwargs(path, self.engine_kwargs))
+            if self.max_wait_ms is not None:
+                engine.start_batching(engine.max_batch_size, self.max_wait_ms)
+        except Exception as e:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[name]
+            self._engines[name] = engine
+            self._sizes[name] = engine_bytes(engine)
+            self.loads += 1
+            evicted = self._evict(keep=name)
+        future.set_result(engine)
+
+        # callers still holding an evicted engine can finish, it just stops batching
+        for old in evicted:
+            old.close()
+        return engine
+
+    def _evict(self, keep):
+        """
+        Drops least recently used engines until the budget is met and returns
+        them; the caller closes them once the lock is released.
+        """
+        evicted = []
+        for name in list(self._engines):
+            if self.max_bytes is None or sum(self._sizes.values()) <= self.max_bytes:
+                break
+            if name == keep or name in self._pinned:
+                continue
+            evicted.append(self._engines.pop(name))
+            del self._sizes[name]
+            self.evictions += 1
+        return evicted
+
+    def close(self):
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._sizes.clear()
+        for engine in engines:
+            engine.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": self.names(),
+                "loaded": list(self._engines),
+                "bytes": sum(self._sizes.values()),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
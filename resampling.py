@@ -0,0 +1,250 @@
+"""
+Rational polyphase resampling shared by the inference input path, the metrics
+and the dataset tools.
+
+The rate change old_rate -> new_rate is reduced to up / down and done with a
+Kaiser-windowed sinc low-pass (the same design as scipy.signal.resample_poly),
+split into `up` polyphase filters. Designs are cached per (up, down), so
+repeated uploads at 16 or 44.1 kHz only pay for the filtering, and every
+output sample only touches the few input samples under its filter.
+
+`resample` works on whole signals; `StreamingResampler` takes arbitrary blocks
+and produces the same samples incrementally.
+
+    python resampling.py            # benchmark against the old interp1d helpers
+"""
+import argparse
+import math
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Kaiser window shape and half length (in taps per rate step), as in resample_poly
+KAISER_BETA = 5.0
+HALF_LEN_FACTOR = 10
+
+# outputs computed per vectorized step, bounds the gathered temporary
+_BLOCK = 1 << 15
+
+
+def _ratio(old_rate, new_rate):
+    old_rate, new_rate = int(old_rate), int(new_rate)
+    if old_rate <= 0 or new_rate <= 0:
+        raise ValueError("Sample rates must be positive, got {} and {}".format(old_rate, new_rate))
+    g = math.gcd(old_rate, new_rate)
+    return new_rate // g, old_rate // g
+
+
+@lru_cache(maxsize=32)
+def polyphase_filters(up, down):
+    """
+    Polyphase decomposition of the low-pass for an up/down rate change.
+
+    Returns (filters, reach): filters[p] holds the taps applied to input samples
+    n0 - reach ... n0 + reach for an output sample with phase p and base input n0.
+    """
+    max_rate = max(up, down)
+    half_len = HALF_LEN_FACTOR * max_rate
+    n_taps = 2 * half_len + 1
+
+    # windowed sinc with unit DC gain (scipy.signal.firwin), scaled by up for the zero stuffing
+    cutoff = 1.0 / max_rate
+    m = np.arange(n_taps) - half_len
+    h = cutoff * np.sinc(cutoff * m) * np.kaiser(n_taps, KAISER_BETA)
+    h = h / h.sum() * up
+
+    # output sample k sits at upsampled position k * down; input n at n * up
+    reach = half_len // up + 1
+    d = np.arange(-reach, reach + 1)
+    index = half_len + np.arange(up)[:, None] - d[None, :] * up
+    valid = (index >= 0) & (index < n_taps)
+    filters = np.where(valid, h[np.clip(index, 0, n_taps - 1)], 0.0)
+    return filters, reach
+
+
+def output_length(n_in, old_rate, new_rate):
+    up, down = _ratio(old_rate, new_rate)
+    return -(-n_in * up // down)
+
+
+def _filter(x, start, stop, up, down, offset=0):
+    """
+    Output samples start..stop of the resampled signal, from a (..., n) array
+    whose first sample is input sample `offset`. Samples outside x count as zero.
+    """
+    filters, reach = polyphase_filters(up, down)
+    taps = filters.shape[1]
+    lead = x.shape[:-1]
+    if x.shape[-1] == 0:
+        # no input: every output sample is zero
+        return np.zeros(lead + (max(stop - start, 0),))
+    x = x.reshape(-1, x.shape[-1])
+    channels = x.shape[0]
+
+    y = np.empty((channels, max(stop - start, 0)))
+    for block_start in range(start, stop, _BLOCK):
+        block_stop = min(stop, block_start + _BLOCK)
+        n_first = block_start * down // up
+        first = n_first - reach - offset
+        last = (block_stop - 1) * down // up + reach + 1 - offset
+
+        # zero-pad only the span this block needs
+        window = x[:, max(first, 0):max(min(last, x.shape[1]), 0)]
+        left = max(-first, 0)
+        window = np.ascontiguousarray(np.pad(window, ((0, 0), (left, last - first - left - window.shape[1]))))
+
+        # outputs k, k + up, k + 2 * up, ... share a phase and step `down` inputs apart,
+        # so each phase is one product of a strided (no copy) view with its filter
+        for k in range(block_start, min(block_start + up, block_stop)):
+            n0, phase = divmod(k * down, up)
+            count = -(-(block_stop - k) // up)
+            frames = np.lib.stride_tricks.as_strided(
+                window[:, n0 - n_first:], shape=(channels, count, taps),
+                strides=(window.strides[0], down * window.strides[1], window.strides[1]), writeable=False)
+            y[:, k - start:block_stop - start:up] = frames @ filters[phase]
+
+    return y.reshape(lead + (-1,))
+
+
+def resample(original, old_rate, new_rate, axis=0):
+    """
+    Resamples `original` from old_rate to new_rate along `axis` (time on axis 0 by
+    default, like the interp1d helpers this replaces). The output has
+    ceil(n * new_rate / old_rate) samples and the input dtype for float inputs.
+    """
+    if old_rate == new_rate:
+        return original
+    up, down = _ratio(old_rate, new_rate)
+
+    x = np.moveaxis(np.asarray(original), axis, -1)
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    n_out = -(-x.shape[-1] * up // down)
+    if n_out == 0:
+        return np.moveaxis(np.zeros(x.shape, dtype=dtype), -1, axis)
+    y = _filter(x.astype(np.float64, copy=False), 0, n_out, up, down)
+    return np.moveaxis(y.astype(dtype, copy=False), -1, axis)
+
+
+class StreamingResampler():
+    """
+    Incremental version of `resample` for (..., samples) blocks: `process` returns
+    the output samples whose filter support is complete, `flush` the rest. The
+    concatenated output is the same as resampling the whole signal at once.
+    """
+    def __init__(self, old_rate, new_rate):
+        self.old_rate = old_rate
+        self.new_rate = new_rate
+        self.up, self.down = _ratio(old_rate, new_rate)
+        _, self.reach = polyphase_filters(self.up, self.down)
+        self.reset()
+
+    def reset(self):
+        # unconsumed input, whose first sample is input sample self._offset
+        self._buffer = None
+        self._offset = 0
+        self._received = 0
+        # next output sample to produce
+        self._next = 0
+
+    def _run(self, stop):
+        y = _filter(self._buffer, self._next, stop, self.up, self.down, self._offset)
+        self._next = stop
+
+        # drop input no later output can reach
+        keep_from = max(self._next * self.down // self.up - self.reach, self._offset)
+        self._buffer = self._buffer[..., keep_from - self._offset:]
+        self._offset = keep_from
+        return y
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if self._buffer is None:
+            self._buffer = block
+        else:
+            self._buffer = np.concatenate([self._buffer, block], axis=-1)
+        self._received += block.shape[-1]
+
+        if self.old_rate == self.new_rate:
+            output, self._buffer = self._buffer, self._buffer[..., :0]
+            return output
+
+        # output k needs inputs up to floor(k * down / up) + reach
+        available = self._received - 1 - self.reach
+        stop = (available * self.up) // self.down + 1 if available >= 0 else 0
+        return self._run(max(stop, self._next))
+
+    def flush(self):
+        if self._buffer is None:
+            return np.zeros(0)
+        if self.old_rate == self.new_rate:
+            output = self._buffer
+        else:
+            output = self._run(max(-(-self._received * self.up // self.down), self._next))
+        self.reset()
+        return output
+
+
+def interp1d_resample(original, old_rate, new_rate):
+    """
+    The linear-interpolation helper previously duplicated in metrics_utils.py and
+    Noise_dataset_generator.py, kept for the benchmark.
+    """
+    from scipy import interpolate
+
+    duration = original.shape[0] / old_rate
+    time_old = np.linspace(0, duration, original.shape[0])
+    time_new = np.linspace(0, duration, int(original.shape[0] * new_rate / old_rate))
+    interpolator = interpolate.interp1d(time_old, original.T)
+    return interpolator(time_new).T
+
+
+def _alias_db(resampler, old_rate, new_rate, seconds=1.0):
+    # a tone above the new Nyquist frequency should vanish after downsampling
+    t = np.arange(int(old_rate * seconds)) / old_rate
+    tone = np.sin(2 * np.pi * 0.75 * new_rate * t)
+    y = resampler(tone, old_rate, new_rate)
+    return 10 * np.log10(np.mean(y ** 2) / np.mean(tone ** 2) + 1e-20)
+
+
+def benchmark(seconds=10.0, repeats=3):
+    """
+    Times polyphase and interp1d resampling of white noise for common rate pairs
+    and measures how much of an out-of-band tone aliases into downsampled output.
+    """
+    rng = np.random.RandomState(0)
+    methods = [("polyphase", resample), ("interp1d", interp1d_resample)]
+    results = []
+    for old_rate, new_rate in [(16000, 48000), (44100, 48000), (48000, 16000), (48000, 10000)]:
+        x = rng.randn(int(seconds * old_rate))
+        row = {"old_rate": old_rate, "new_rate": new_rate}
+        for name, function in methods:
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                function(x, old_rate, new_rate)
+                best = min(best, time.perf_counter() - start)
+            row[name + "_ms"] = best * 1000
+            if new_rate < old_rate:
+                row[name + "_alias_db"] = _alias_db(function, old_rate, new_rate)
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fstring = "{:>14}{:>16}{:>16}{:>18}{:>18}"
+    print(fstring.format("rates", "polyphase ms", "interp1d ms", "polyphase alias", "interp1d alias"))
+    for row in benchmark(args.seconds, args.repeats):
+        print(fstring.format("{}->{}".format(row["old_rate"], row["new_rate"]),
+                             "{:.1f}".format(row["polyphase_ms"]), "{:.1f}".format(row["interp1d_ms"]),
+                             *("{:.1f} dB".format(row[key]) if key in row else "-"
+                               for key in ("polyphase_alias_db", "interp1d_alias_db"))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,427 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Request, Response, g, request, send_file, jsonify
 from flask_cors import CORS
+import io
 import os
-import subprocess
-import sys
-import ffmpeg 
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+
+from audio_io import AudioDecodeError, decode_audio, encode_pcm, encode_wav, wav_header
+from cache import ResultCache, cache_key
+from dcunet import SAMPLE_RATE
+from inference import DEFAULT_WEIGHTS
+from jobs import JobLimitError, JobManager
+from registry import ModelRegistry, discover
+import telemetry
+from vad import VoiceActivityGate
+
+
+
+class InMemoryRequest(Request):
+    """
+    Keeps multipart uploads in memory; Werkzeug would spool anything over 500 KiB to a temporary file.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+# Uploads are held in memory, so their size is bounded (413 beyond DENOISE_MAX_UPLOAD_MB)
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.environ.get("DENOISE_MAX_UPLOAD_MB", 200)) * 2 ** 20)
 CORS(app)
 
-SAMPLES_FOLDER = "Samples"
-INPUT_FOLDER = os.path.join(SAMPLES_FOLDER, "Sample_Test_Input")
-OUTPUT_FOLDER = SAMPLES_FOLDER  # Output will be in the Samples folder
-os.makedirs(INPUT_FOLDER, exist_ok=True)
+# Built once at start-up and shared by every request
+MODEL_WEIGHTS = os.environ.get("DENOISE_WEIGHTS", DEFAULT_WEIGHTS)
+MAX_BATCH_SIZE = int(os.environ.get("DENOISE_MAX_BATCH", 4))
+# A .onnx file selects the ONNX Runtime backend, with DENOISE_ORT_THREADS intra-op threads
+ORT_THREADS = int(os.environ.get("DENOISE_ORT_THREADS", 0)) or None
+# Batch norm is folded into the convolutions at start-up unless DENOISE_OPTIMIZE=0; run
+# `python optimize.py --weights ...` once so workers map the saved folded model instead
+OPTIMIZE = os.environ.get("DENOISE_OPTIMIZE", "1") != "0"
+# DENOISE_NATIVE=1 runs the complex channel-split model (dcunet_native.py) instead
+NATIVE = os.environ.get("DENOISE_NATIVE", "0") == "1"
+# DENOISE_PRECISION=bfloat16 runs the convolutions under CPU autocast (see precision.py)
+PRECISION = os.environ.get("DENOISE_PRECISION", "float32")
+# DENOISE_VAD=1 skips the model on long silent stretches (attenuated passthrough)
+VAD = VoiceActivityGate() if os.environ.get("DENOISE_VAD", "0") == "1" else None
+
+# Blocks from concurrent requests are batched for up to this long
+MAX_WAIT_MS = float(os.environ.get("DENOISE_MAX_WAIT_MS", 10))
+
+# Every checkpoint under Pretrained_Weights/ and {noise_class}_{training_type}/Weights can be
+# picked with the `model` form field. Models are loaded on first use and the least recently
+# used ones are dropped beyond DENOISE_MODELS_MB (0 = no limit); DENOISE_WEIGHTS is the
+# default model and stays loaded.
+DEFAULT_MODEL = "default"
+MODELS_MB = float(os.environ.get("DENOISE_MODELS_MB", 0))
+registry = ModelRegistry(discover(), int(MODELS_MB * 2 ** 20) or None, MAX_WAIT_MS,
+                         max_batch_size=MAX_BATCH_SIZE, onnx_threads=ORT_THREADS,
+                         optimize=OPTIMIZE, native=NATIVE, vad=VAD, precision=PRECISION)
+registry.register(DEFAULT_MODEL, MODEL_WEIGHTS, pin=True)
+engine = registry.get(DEFAULT_MODEL)
+
+# Requests are processed in memory by a bounded pool of workers
+WORKERS = int(os.environ.get("DENOISE_WORKERS", os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get("DENOISE_MAX_PENDING", 4 * WORKERS))
+executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="denoise-worker")
+pending_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+# Results of repeated uploads are served from an LRU cache (DENOISE_CACHE_MB=0 disables it),
+# optionally persisted in DENOISE_CACHE_DIR
+CACHE_MB = float(os.environ.get("DENOISE_CACHE_MB", 256))
+CACHE_DIR = os.environ.get("DENOISE_CACHE_DIR") or None
+result_cache = ResultCache(int(CACHE_MB * 2 ** 20), CACHE_DIR) if CACHE_MB > 0 else None
+
+# Long recordings go through /jobs: a separate pool of DENOISE_JOB_WORKERS threads, at most
+# DENOISE_MAX_JOBS jobs and DENOISE_JOBS_MB of uploads, running audio and results, kept for
+# DENOISE_JOB_TTL seconds
+JOB_WORKERS = int(os.environ.get("DENOISE_JOB_WORKERS", 1))
+jobs = JobManager(JOB_WORKERS, int(os.environ.get("DENOISE_MAX_JOBS", 64)),
+                  int(float(os.environ.get("DENOISE_JOBS_MB", 512)) * 2 ** 20),
+                  float(os.environ.get("DENOISE_JOB_TTL", 3600)))
+
+stats_lock = threading.Lock()
+stats = {"active": 0, "pending": 0, "completed": 0, "failed": 0}
+# seconds of denoised audio, and how much of it skipped the model through VAD
+audio_stats = {"seconds": 0.0, "skipped_seconds": 0.0}
+
+
+def _count(key, delta):
+    with stats_lock:
+        stats[key] += delta
+
+
+def _record_audio(seconds, skipped_seconds, processing_seconds):
+    with stats_lock:
+        audio_stats["seconds"] += seconds
+        audio_stats["skipped_seconds"] += skipped_seconds
+    telemetry.REGISTRY.inc("audio_seconds_total", seconds, "Seconds of audio denoised")
+    telemetry.REGISTRY.inc("skipped_audio_seconds_total", skipped_seconds, "Seconds of audio that skipped the model (VAD)")
+    if seconds > 0:
+        telemetry.REGISTRY.observe("rtf", processing_seconds / seconds, "Processing time over audio duration per request")
+
+
+# Sampled on every scrape of /metrics
+telemetry.REGISTRY.gauge("requests_active", lambda: stats["active"], "Requests being processed")
+telemetry.REGISTRY.gauge("requests_pending", lambda: stats["pending"], "Requests waiting for a worker")
+telemetry.REGISTRY.gauge("batch_queue_depth", lambda: sum(e.queued_blocks() for e in registry.loaded().values()),
+                         "Block groups waiting for the micro-batcher")
+telemetry.REGISTRY.gauge("jobs_queued", lambda: jobs.stats()["jobs"].get("queued", 0), "Background jobs waiting")
+telemetry.REGISTRY.gauge("jobs_running", lambda: jobs.stats()["jobs"].get("running", 0), "Background jobs running")
+telemetry.REGISTRY.gauge("models_loaded", lambda: len(registry.loaded()), "Models held in memory")
 
-def convert_to_wav(input_path, output_path):
-    """ Convert any browser-recorded file (WebM/OGG) to WAV using ffmpeg. """
+
+def denoise_upload(data, model=DEFAULT_MODEL, progress=None, reserve=None):
+    """
+    Decode, denoise and encode one upload entirely in memory.
+    Returns the WAV bytes and the fraction of the audio that skipped the model
+    (None for cached results). `reserve(nbytes)` is called with the memory the
+    decoded audio will take, see JobManager.submit.
+    """
+    start = time.perf_counter()
+    engine = registry.get(model)
+    with telemetry.span("decode"):
+        input_audio, sr = decode_audio(data)
+    if reserve is not None:
+        # the float32 input and the denoised output are both held until the WAV is encoded
+        reserve(2 * input_audio.nbytes)
+
+    key = None
+    if result_cache is not None:
+        with telemetry.span("cache_lookup"):
+            key = cache_key(input_audio, sr, engine.identity())
+            output = result_cache.get(key)
+        if output is not None:
+            return output, None
+
+    denoise_stats = {}
+    with telemetry.span("denoise"):
+        denoised = engine.denoise(torch.from_numpy(input_audio), sr, denoise_stats, progress)
+    with telemetry.span("encode"):
+        output = encode_wav(denoised.numpy(), SAMPLE_RATE)
+
+    _record_audio(denoise_stats["samples"] / SAMPLE_RATE, denoise_stats["skipped_samples"] / SAMPLE_RATE,
+                  time.perf_counter() - start)
+
+    if key is not None:
+        result_cache.put(key, output)
+    return output, denoise_stats["skipped_fraction"]
+
+
+def process_upload(data, model=DEFAULT_MODEL, submitted=None):
+    """ `denoise_upload` for a synchronous /denoise request, with request accounting. """
+    if submitted is not None:
+        telemetry.REGISTRY.observe("stage_seconds", time.perf_counter() - submitted, stage="queue_wait")
+    _count("pending", -1)
+    _count("active", 1)
     try:
-        ffmpeg.input(input_path).output(output_path, format="wav", acodec="pcm_s16le").run(overwrite_output=True)
-        return True
+        return denoise_upload(data, model)
+    finally:
+        _count("active", -1)
+
+
+def stream_upload(data, model, submitted, messages, cancelled):
+    """
+    Worker side of /denoise?stream=1. Puts ("start", (channels, skipped_fraction))
+    or ("cached", wav_bytes) on the `messages` queue, then ("pcm", bytes) for each
+    denoised piece and ("end", None); ("error", exception) on failure. Stops early
+    once `cancelled` is set.
+    """
+    telemetry.REGISTRY.observe("stage_seconds", time.perf_counter() - submitted, stage="queue_wait")
+    _count("pending", -1)
+    _count("active", 1)
+    start = time.perf_counter()
+    try:
+        engine = registry.get(model)
+        with telemetry.span("decode"):
+            input_audio, sr = decode_audio(data)
+
+        key = None
+        if result_cache is not None:
+            with telemetry.span("cache_lookup"):
+                key = cache_key(input_audio, sr, engine.identity())
+                cached = result_cache.get(key)
+            if cached is not None:
+                _count("completed", 1)
+                messages.put(("cached", cached))
+                return
+
+        denoise_stats = {}
+        pieces = engine.iter_denoise(torch.from_numpy(input_audio), sr, denoise_stats)
+        channels = input_audio.shape[0]
+        messages.put(("start", (channels, denoise_stats["skipped_fraction"])))
+
+        pcm = []
+        for piece in pieces:
+            if cancelled.is_set():
+                return
+            pcm.append(encode_pcm(piece.numpy()))
+            if len(pcm) == 1:
+                telemetry.REGISTRY.observe("stage_seconds", time.perf_counter() - start, stage="first_audio")
+            messages.put(("pcm", pcm[-1]))
     except Exception as e:
-        print("Error converting to WAV:", e)
-        return False
+        _count("failed", 1)
+        messages.put(("error", e))
+        return
+    finally:
+        _count("active", -1)
+
+    _count("completed", 1)
+    messages.put(("end", None))
+    _record_audio(denoise_stats["samples"] / SAMPLE_RATE, denoise_stats["skipped_samples"] / SAMPLE_RATE,
+                  time.perf_counter() - start)
+    if key is not None:
+        data_bytes = sum(len(chunk) for chunk in pcm)
+        result_cache.put(key, wav_header(channels, SAMPLE_RATE, data_bytes) + b"".join(pcm))
+
+
+def process_job(data, model=DEFAULT_MODEL, progress=None, reserve=None):
+    """ `denoise_upload` for a /jobs job. Returns the WAV bytes and extra status fields. """
+    output, skipped_fraction = denoise_upload(data, model, progress, reserve)
+    return output, {"model": model, "skipped_fraction": skipped_fraction}
+
 
 @app.route("/denoise", methods=["POST"])
 def denoise():
     if "audio" not in request.files:
         return jsonify({"error": "No file provided"}), 400
 
-    audio_file = request.files["audio"]
-    input_path = os.path.join(INPUT_FOLDER, audio_file.filename)
-    wav_path = os.path.join(INPUT_FOLDER, "converted_input.wav")  # Ensuring WAV format
-    output_path = os.path.join(OUTPUT_FOLDER, "denoised.wav")
+    model, error = _upload_model()
+    if error is not None:
+        return error
 
-    audio_file.save(input_path)
+    if not pending_slots.acquire(blocking=False):
+        return jsonify({"error": "Server busy, try again later"}), 503
 
-    # Convert WebM/OGG/M4A to WAV
-    if not audio_file.filename.endswith(".wav"):
-        success = convert_to_wav(input_path, wav_path)
-        if not success:
-            return jsonify({"error": "Audio conversion failed"}), 500
-    else:
-        wav_path = input_path  # If already WAV, use original file
+    with telemetry.span("upload_read"):
+        data = request.files["audio"].read()
+    if request.args.get("stream") == "1":
+        return _stream_denoise(data, model)
 
-    # Run MODEL.py with the converted WAV file
     try:
-        subprocess.run([sys.executable, "MODEL.py"], check=True)
-    except subprocess.CalledProcessError as e:
-        return jsonify({"error": f"Model processing failed: {e}"}), 500
+        _count("pending", 1)
+        try:
+            output, skipped_fraction = executor.submit(process_upload, data, model, time.perf_counter()).result()
+        except AudioDecodeError as e:
+            _count("failed", 1)
+            return jsonify({"error": f"Audio conversion failed: {e}"}), 500
+        except Exception as e:
+            _count("failed", 1)
+            return jsonify({"error": f"Model processing failed: {e}"}), 500
+        _count("completed", 1)
+    finally:
+        pending_slots.release()
+
+    response = send_file(io.BytesIO(output), mimetype="audio/wav")
+    response.headers["Content-Disposition"] = "attachment; filename=denoised.wav"
+    if skipped_fraction is not None:
+        response.headers["X-Skipped-Fraction"] = "{:.4f}".format(skipped_fraction)
+    sending = time.perf_counter()
+    response.call_on_close(lambda: telemetry.REGISTRY.observe("stage_seconds", time.perf_counter() - sending,
+                                                              stage="send"))
+    return response
+
+
+def _stream_denoise(data, model):
+    """
+    /denoise?stream=1: sends a WAV header of unknown length, then the PCM of each
+    denoised piece as soon as its forward pass finishes. The work runs on the
+    worker pool (see `stream_upload`); the pending slot is released when the
+    response is closed.
+    """
+    messages = queue.Queue()
+    cancelled = threading.Event()
+    _count("pending", 1)
+    executor.submit(stream_upload, data, model, time.perf_counter(), messages, cancelled)
+
+    kind, value = messages.get()
+    if kind == "error":
+        pending_slots.release()
+        if isinstance(value, AudioDecodeError):
+            return jsonify({"error": f"Audio conversion failed: {value}"}), 500
+        return jsonify({"error": f"Model processing failed: {value}"}), 500
+
+    if kind == "cached":
+        pending_slots.release()
+        response = send_file(io.BytesIO(value), mimetype="audio/wav")
+        response.headers["Content-Disposition"] = "attachment; filename=denoised.wav"
+        return response
+
+    channels, skipped_fraction = value
+
+    def generate():
+        try:
+            yield wav_header(channels, SAMPLE_RATE)
+            while True:
+                kind, value = messages.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    # the status line is already sent, the client sees a truncated stream
+                    raise value
+                yield value
+        finally:
+            # stops the worker after its current forward pass if the client went away
+            cancelled.set()
+
+    response = Response(generate(), mimetype="audio/wav")
+    response.headers["Content-Disposition"] = "attachment; filename=denoised.wav"
+    response.headers["X-Skipped-Fraction"] = "{:.4f}".format(skipped_fraction)
+    # ask proxies not to buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(pending_slots.release)
+    return response
+
+
+def _upload_model():
+    """ The `model` form field, or an error response for unknown models. """
+    model = request.form.get("model", DEFAULT_MODEL)
+    if model not in registry.names():
+        return None, (jsonify({"error": f"Unknown model {model!r}", "models": registry.names()}), 400)
+    return model, None
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    if "audio" not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+
+    model, error = _upload_model()
+    if error is not None:
+        return error
+
+    try:
+        job = jobs.submit(process_job, request.files["audio"].read(), model)
+    except JobLimitError as e:
+        return jsonify({"error": str(e)}), 503
+
+    response = jsonify({"id": job.id, "status": job.status,
+                        "status_url": f"/jobs/{job.id}", "result_url": f"/jobs/{job.id}/result"})
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response, 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def delete_job(job_id):
+    if not jobs.delete(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    return "", 204
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error}), 500
+    if job.status != "done":
+        return jsonify(job.to_dict()), 409
+
+    response = send_file(io.BytesIO(job.result), mimetype="audio/wav")
+    response.headers["Content-Disposition"] = "attachment; filename=denoised.wav"
+    return response
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _count_request(response):
+    # for streamed responses this is the time to the first byte, not the full body
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    telemetry.REGISTRY.inc("requests_total", 1, "Requests by endpoint and status code",
+                           endpoint=endpoint, method=request.method, status=response.status_code)
+    if endpoint != "/metrics":
+        telemetry.REGISTRY.observe("request_seconds", time.perf_counter() - g.request_start,
+                                   "Time from request start to response headers", endpoint=endpoint)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """ Prometheus scrape target: stage latency quantiles, request counts and queue gauges. """
+    return Response(telemetry.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/status", methods=["GET"])
+def status():
+    with stats_lock:
+        requests = dict(stats)
+        audio = dict(audio_stats)
+    audio["skipped_fraction"] = audio["skipped_seconds"] / audio["seconds"] if audio["seconds"] else 0.0
+    return jsonify({
+        "workers": WORKERS,
+        "max_pending": MAX_PENDING,
+        "requests": requests,
+        "audio": audio,
+        "vad": VAD is not None,
+        "precision": {"requested": PRECISION, "default_model": engine.precision,
+                      "snr_db": engine.precision_snr_db},
+        "batching": {
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_wait_ms": MAX_WAIT_MS,
+            "queued_requests": sum(e.queued_blocks() for e in registry.loaded().values()),
+        },
+        "models": registry.stats(),
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "jobs": jobs.stats(),
+    })
 
-    return send_file(output_path, as_attachment=True)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # The reloader would import this module (and load the model) twice
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False, threaded=True)
@@ -0,0 +1,106 @@
+"""
+Overlap-add streaming on top of DenoiseEngine.
+
+Audio is pushed in arbitrary blocks; the model runs on overlapping windows and
+neighbouring windows are cross-faded, so only about one window of audio is
+held in memory however long the stream is.
+"""
+import math
+
+import torch
+import torch.nn.functional as F
+
+from inference import MAX_LEN, _inference_mode
+
+
+class StreamDenoiser():
+    """
+    Incremental overlap-add denoiser. `push` blocks of mono SAMPLE_RATE audio
+    and get back whatever output is final, then `flush` at the end of the stream.
+    """
+    def __init__(self, engine, window=MAX_LEN, hop=None):
+        if hop is None:
+            hop = window * 3 // 4
+        # the cross-fade only covers neighbouring windows
+        if not window // 2 <= hop <= window:
+            raise ValueError("hop must be between window/2 and window, got {} for window {}".format(hop, window))
+
+        if engine.valid_length(window) != window:
+            raise ValueError("window of {} samples does not fit the network, the next valid one is {}".format(
+                window, engine.valid_length(window)))
+
+        self.engine = engine
+        self.window = window
+        self.hop = hop
+        self.overlap = window - hop
+
+        # Raised-cosine fades, fade_in + fade_out == 1 over the overlap
+        t = (torch.arange(self.overlap, dtype=torch.float32) + 0.5) / max(self.overlap, 1)
+        self.fade_in = torch.sin(0.5 * math.pi * t) ** 2
+        self.fade_out = 1 - self.fade_in
+
+        self.reset()
+
+    def reset(self):
+        # input not yet consumed, starting at the current window
+        self._buffer = torch.zeros(0)
+        # faded-out overlap of the previous window's output
+        self._tail = None
+
+    def _run(self, frame):
+        with _inference_mode():
+            output = self.engine.denoise_chunks(frame.unsqueeze(0).to(self.engine.device))
+        return output[0].cpu()
+
+    def _emit(self, y, n):
+        output = y[:n].clone()
+        if self._tail is not None and self.overlap > 0:
+            output[:self.overlap] = output[:self.overlap] * self.fade_in + self._tail
+        return output
+
+    def push(self, block):
+        """
+        Adds a block of samples and returns the output that is now complete.
+        """
+        block = torch.as_tensor(block, dtype=torch.float32).reshape(-1)
+        self._buffer = torch.cat([self._buffer, block])
+
+        outputs = []
+        while self._buffer.numel() >= self.window:
+            y = self._run(self._buffer[:self.window])
+            outputs.append(self._emit(y, self.hop))
+            self._tail = y[self.hop:] * self.fade_out
+            self._buffer = self._buffer[self.hop:]
+
+        if not outputs:
+            return torch.zeros(0)
+        return torch.cat(outputs)
+
+    def flush(self):
+        """
+        Processes the remaining samples (zero-padded to a window) and ends the stream.
+        """
+        remaining = self._buffer.numel()
+        if remaining == 0:
+            self.reset()
+            return torch.zeros(0)
+
+        y = self._run(F.pad(self._buffer, (0, self.window - remaining)))
+        output = self._emit(y, remaining)
+        self.reset()
+        return output
+
+
+def stream_denoise(engine, blocks, window=MAX_LEN, hop=None):
+    """
+    Generator over denoised blocks for an iterable of mono SAMPLE_RATE PCM blocks.
+    """
+    denoiser = StreamDenoiser(engine, window, hop)
+    for block in blocks:
+        output = denoiser.push(block)
+        if output.numel():
+            yield output
+
+    output = denoiser.flush()
+    if output.numel():
+        yield output
@@ -0,0 +1,181 @@
+"""
+Latency spans and counters for the serving path, exposed in the Prometheus text format.
+
+Code under measurement wraps each stage in `span("stage")`; durations go into
+a per-stage reservoir sample from which p50/p95/p99 are reported, alongside
+totals, counters and gauges read at scrape time:
+
+    with telemetry.span("decode"):
+        audio, sr = decode_audio(data)
+
+    telemetry.REGISTRY.render()     # body of GET /metrics
+
+Only the standard library is used, so the engine can record its own stages
+(STFT, forward, iSTFT) without adding to its import time.
+"""
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# latency samples kept per stage; enough for stable p99 estimates
+RESERVOIR_SIZE = 2048
+
+
+class Summary():
+    """
+    Count, sum and a uniform reservoir sample of observed values.
+    """
+    def __init__(self, size=RESERVOIR_SIZE, seed=0):
+        self.size = size
+        self.count = 0
+        self.sum = 0.0
+        self._samples = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if len(self._samples) < self.size:
+                self._samples.append(value)
+            else:
+                # reservoir sampling keeps every value seen with equal probability
+                index = self._random.randrange(self.count)
+                if index < self.size:
+                    self._samples[index] = value
+
+    def quantiles(self, quantiles=QUANTILES):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {q: math.nan for q in quantiles}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles}
+
+    def snapshot(self):
+        quantiles = self.quantiles()
+        with self._lock:
+            return self.count, self.sum, quantiles
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace('"', '\\"'))
+                          for key, value in sorted(labels.items())) + "}"
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Registry():
+    """
+    Named summaries, counters and gauges, each keyed by a label set.
+    """
+    def __init__(self, prefix="denoise"):
+        self.prefix = prefix
+        self._summaries = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _name(self, name, help_text):
+        name = "{}_{}".format(self.prefix, name)
+        if help_text:
+            self._help[name] = help_text
+        return name
+
+    def summary(self, name, help_text=None, **labels):
+        key = (self._name(name, help_text), tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._summaries:
+                self._summaries[key] = Summary()
+            return self._summaries[key]
+
+    def observe(self, name, value, help_text=None, **labels):
+        self.summary(name, help_text, **labels).observe(value)
+
+    def inc(self, name, value=1.0, help_text=None, **labels):
+        key = (self._name(name, help_text), tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def gauge(self, name, function, help_text=None, **labels):
+        """
+        Registers `function()` to be read on every scrape.
+        """
+        key = (self._name(name, help_text), tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = function
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Times the enclosed block into the `stage_seconds` summary for `stage`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start,
+                         "Wall time of each serving stage", stage=stage)
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            summaries = sorted(self._summaries.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append("# HELP {} {}".format(name, self._help[name]))
+                lines.append("# TYPE {} {}".format(name, kind))
+
+        for (name, labels), summary in summaries:
+            declare(name, "summary")
+            labels = dict(labels)
+            count, total, quantiles = summary.snapshot()
+            for q, value in quantiles.items():
+                lines.append("{}{} {}".format(name, _format_labels(dict(labels, quantile=q)), _format_value(value)))
+            lines.append("{}_sum{} {}".format(name, _format_labels(labels), _format_value(total)))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), count))
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append("{}{} {}".format(name, _format_labels(dict(labels)), _format_value(value)))
+
+        for (name, labels), function in gauges:
+            try:
+                value = float(function())
+            except Exception:
+                value = math.nan
+            declare(name, "gauge")
+            lines.append("{}{} {}".format(name, _format_labels(dict(labels)), _format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the server and the engine
+REGISTRY = Registry()
+
+
+def span(stage):
+    return REGISTRY.span(stage)
@@ -0,0 +1,52 @@
+import time
+
+from jobs import JobManager
+
+
+def wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.finished is None and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_result_larger_than_max_bytes_fails():
+    manager = JobManager(max_bytes=100)
+    try:
+        job = wait(manager.submit(lambda data, progress, reserve: data * 20, b"x" * 10))
+        assert job.status == "failed"
+        assert job.result is None
+        assert manager.stats()["bytes"] == 0
+    finally:
+        manager.close()
+
+
+def test_results_drop_finished_jobs_to_fit():
+    manager = JobManager(max_bytes=100)
+    try:
+        first = wait(manager.submit(lambda data, progress, reserve: data * 6, b"x" * 10))
+        second = wait(manager.submit(lambda data, progress, reserve: data * 6, b"y" * 10))
+        assert first.status == second.status == "done"
+        assert manager.get(first.id) is None
+        assert manager.stats()["bytes"] == 60
+    finally:
+        manager.close()
+
+
+def test_running_job_reserves_its_audio():
+    manager = JobManager(max_bytes=100)
+    try:
+        def function(data, progress, reserve):
+            reserve(80)
+            assert manager.stats()["bytes"] == 90
+            return b""
+
+        job = wait(manager.submit(function, b"x" * 10))
+        assert job.status == "done", job.error
+        assert manager.stats()["bytes"] == 0
+
+        job = wait(manager.submit(lambda data, progress, reserve: reserve(200), b"x" * 10))
+        assert job.status == "failed"
+        assert "memory" in job.error
+    finally:
+        manager.close()
@@ -0,0 +1,83 @@
+"""
+Energy-based voice activity gating in front of DCUnet20.
+
+Frames whose level stays below a threshold are treated as silence. Silent runs
+that are long enough to be worth skipping are passed through attenuated
+instead of being run through the model; DenoiseEngine cross-fades the two at
+every boundary so the gating does not click.
+"""
+import torch
+import torch.nn.functional as F
+
+
+class VoiceActivityGate():
+    """
+    Splits a waveform into active regions worth denoising.
+
+    A frame is active when its RMS level is above `threshold_db` (dBFS) and within
+    `dynamic_range_db` of the loudest frame. Activity is extended by `hangover_ms`
+    on both sides, and silences shorter than `min_silence_ms` are kept active.
+    """
+    def __init__(self, threshold_db=-50, dynamic_range_db=40, frame_ms=20, hangover_ms=200,
+                 min_silence_ms=1000, silence_gain=0.1, fade_ms=20):
+        self.threshold_db = threshold_db
+        self.dynamic_range_db = dynamic_range_db
+        self.frame_ms = frame_ms
+        self.hangover_ms = hangover_ms
+        self.min_silence_ms = min_silence_ms
+        # passthrough gain for skipped audio (-20 dB)
+        self.silence_gain = silence_gain
+        self.fade_ms = fade_ms
+
+    def identity(self):
+        return "vad{}/{}/{}/{}/{}/{}/{}".format(self.threshold_db, self.dynamic_range_db, self.frame_ms,
+                                                self.hangover_ms, self.min_silence_ms, self.silence_gain,
+                                                self.fade_ms)
+
+    def frame_activity(self, waveform, sample_rate):
+        """
+        Boolean activity per frame for a (samples,) or (channels, samples) waveform;
+        a frame is active when any channel is.
+        """
+        waveform = waveform.reshape(-1, waveform.size(-1))
+        channels, length = waveform.shape
+        frame_len = max(1, int(sample_rate * self.frame_ms / 1000))
+        n_frames = -(-length // frame_len)
+        frames = F.pad(waveform, (0, n_frames * frame_len - length)).view(channels, n_frames, frame_len)
+
+        level_db = 10 * torch.log10(frames.pow(2).mean(dim=2) + 1e-10).max(dim=0)[0]
+        threshold = max(self.threshold_db, level_db.max().item() - self.dynamic_range_db)
+        active = (level_db > threshold).float()
+
+        hangover = int(self.hangover_ms / self.frame_ms)
+        if hangover:
+            active = F.max_pool1d(active.view(1, 1, -1), 2 * hangover + 1, stride=1, padding=hangover).view(-1)
+        return active.bool(), frame_len
+
+    def active_regions(self, waveform, sample_rate):
+        """
+        List of (start, end) sample ranges of a (samples,) or (channels, samples)
+        waveform that should be denoised.
+        """
+        active, frame_len = self.frame_activity(waveform, sample_rate)
+        min_silence = max(1, int(self.min_silence_ms / self.frame_ms))
+
+        regions = []
+        start = None
+        silence = 0
+        for i, is_active in enumerate(active.tolist()):
+            if is_active:
+                if start is None:
+                    start = i
+                elif silence:
+                    if silence >= min_silence:
+                        regions.append((start, i - silence))
+                        start = i
+                silence = 0
+            elif start is not None:
+                silence += 1
+        if start is not None:
+            regions.append((start, len(active) - silence))
+
+        n = waveform.size(-1)
+        return [(s * frame_len, min(e * frame_len, n)) for s, e in regions]